@@ -1,14 +1,16 @@
 from fastapi import FastAPI
 from fastapi.exceptions import HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 
 from src.middleware import AppExceptionHandlerMiddleware
 from src.utils import handle_http_exception
 from src.description import description
-from src.services import on_startup
+from src.services import on_startup, ABONNEMENT_CONTROL
 from src.api import api_router
 from src.appointplan import appointplan_router
 from src.repetative import repetative_router
+from src.events import events_router, Reconciler
 
 from os import environ
 
@@ -22,13 +24,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 app.add_middleware(AppExceptionHandlerMiddleware)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 app.add_event_handler('startup', on_startup)
+app.add_event_handler('startup', Reconciler.start_periodic)
+app.add_event_handler('shutdown', ABONNEMENT_CONTROL.flush)
 app.add_exception_handler(HTTPException, handle_http_exception)
 
 app.include_router(appointplan_router)
 app.include_router(repetative_router)
 app.include_router(api_router)
+app.include_router(events_router)
 
 
 @app.get('/ping', status_code=200, tags=['Main'])
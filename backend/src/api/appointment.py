@@ -1,12 +1,14 @@
-from fastapi import APIRouter, BackgroundTasks
+from fastapi import APIRouter, BackgroundTasks, Query
 from fastapi.exceptions import HTTPException
+from pydantic import ValidationError
 from datetime import datetime, timedelta
 import asyncio
 
-from src.core import BitrixClient, BXConstants, Settings
+from src.core import BitrixClient, BXConstants, Settings, BatchError
 from src.schemas.api import Appointment, BXAppointment, AbonnementCancelDate
 from src.logger import logger
-from src.utils import BatchBuilder
+from src.services import MIRROR, ABONNEMENT_CONTROL, HISTORY, HISTORY_COMMENTS, fill_previous
+from src.utils import BatchBuilder, batch_items
 
 
 router = APIRouter(prefix="/appointment")
@@ -18,6 +20,7 @@ async def create_appointment(appointment: Appointment, bt: BackgroundTasks) -> B
     aety = BXConstants.appointment.entityTypeId
     fields = appointment.to_bx()
     data = await BitrixClient.create_crm_item(aety, fields)
+    await MIRROR.save_appointments(data)
     appointment = BXAppointment.model_validate(data)
     bt.add_task(logger.debug, f'Appointment id={appointment.id} was created.')
     return appointment
@@ -27,32 +30,33 @@ async def create_appointment(appointment: Appointment, bt: BackgroundTasks) -> B
 async def get_appointment(id: int, bt: BackgroundTasks) -> BXAppointment:
     """Получение элемента смарт-процесса Расписание"""
     aety = BXConstants.appointment.entityTypeId
-    data, comments = await asyncio.gather(
-        BitrixClient.get_crm_item(aety, id),
-        BitrixClient.get_comments_list(id)
-    )
+    data = await BitrixClient.get_crm_item(aety, id)
     if data is None:
         raise HTTPException(status_code=404, detail=f"Appointment id={id} not found.")
     appointment = BXAppointment.model_validate(data)
-    appointment.parse_last_comment(comments)
+    await fill_previous(appointment)
     bt.add_task(logger.debug, f'Appointment id={id} was received.')
     return appointment
 
 
 @router.put("/{id}", status_code=200)
 async def update_appointment(id: int, appointment: Appointment, bt: BackgroundTasks) -> BXAppointment:
-    """Обновление элемента смарт-процесса расписание"""
-    await BitrixClient.fill_comment(id)
+    """
+    Обновление элемента смарт-процесса расписание. Прежнее состояние пишется в локальную историю.
+    Прежнее состояние берется из битры, а не из зеркала: правки в самой битре попадают в зеркало с задержкой,
+    и в историю записалось бы состояние, которого не было.
+    """
     aety = BXConstants.appointment.entityTypeId
-    fields = appointment.to_bx()
-    data, comment = await asyncio.gather(
-        BitrixClient.update_crm_item(aety, id, fields),
-        BitrixClient.get_comments_list(id)
-    )
+    previous = await BitrixClient.get_crm_item(aety, id)
+    if previous is None:
+        raise HTTPException(status_code=404, detail=f"Appointment id={id} not found.")
+    data = await BitrixClient.update_crm_item(aety, id, appointment.to_bx())
+    await asyncio.gather(MIRROR.save_appointments(data), HISTORY.record(previous))
+    HISTORY_COMMENTS.invalidate(id)
     appointment: BXAppointment = BXAppointment.model_validate(data)
-    appointment.parse_last_comment(comment)
+    appointment.set_previous(HISTORY.snapshot(previous))
     bt.add_task(logger.debug, f"Appointment id={id} was updated.")
-    asyncio.create_task(BitrixClient.run_abonnement_control(id))
+    ABONNEMENT_CONTROL.schedule(id)
     return appointment
 
 
@@ -63,14 +67,12 @@ async def cancel_abonnement(
     bt: BackgroundTasks
 ) -> BXAppointment:
     fields = {BXConstants.appointment.uf.abonnement: cancel_date.date}
-    data, comment = await asyncio.gather(
-        BitrixClient.update_crm_item(BXConstants.appointment.entityTypeId, id, fields),
-        BitrixClient.get_comments_list(id)
-    )
+    data = await BitrixClient.update_crm_item(BXConstants.appointment.entityTypeId, id, fields)
+    await MIRROR.save_appointments(data)
     appointment: BXAppointment = BXAppointment.model_validate(data)
-    appointment.parse_last_comment(comment)
+    await fill_previous(appointment)
     bt.add_task(logger.debug, f"Appointment id={id} cancel date was updated")
-    asyncio.create_task(BitrixClient.run_abonnement_control(id))
+    ABONNEMENT_CONTROL.schedule(id)
     return appointment
 
 
@@ -103,7 +105,8 @@ async def update_appointment_massive(id: int, template: Appointment):
     tstart_time, tend_time = tstart.time(), tend.time()
     start_delta, end_delta = new_start - tstart, new_end - tend
     to_update = {}
-    builder = BatchBuilder('crm.item.update')
+    previous = {}
+    command = BatchBuilder('crm.item.update', {"entityTypeId": aety}).compile('id', 'fields')
     for raw_app in all_appointments:
         # СУПЕР ГОВНОКОД ФИЛЬТРАЦИИ
         if tpatient != raw_app.get('ufCrm3Children'):
@@ -129,40 +132,73 @@ async def update_appointment_massive(id: int, template: Appointment):
             BXConstants.appointment.uf.end: (end + end_delta).isoformat()
         }
         raw_app_id = raw_app.get('id')
-        builder.params = {"entityTypeId": aety, 'id': raw_app_id, 'fields': fields}
-        to_update[raw_app_id] = builder.build()
-    await BitrixClient.fill_comment(*to_update)
-    result = await BitrixClient.call_batch(to_update)
-    asyncio.current_task(BitrixClient.run_abonnement_control(*to_update))
+        to_update[raw_app_id] = command.build(id=raw_app_id, fields=fields)
+        previous[raw_app_id] = raw_app
+    error = None
+    try:
+        result = await BitrixClient.call_batch(to_update)
+    except BatchError as exc:
+        result, error = exc.successes, exc
+    items = batch_items(result)
+    await asyncio.gather(
+        MIRROR.save_appointments(*items),
+        HISTORY.record(*(previous[i['id']] for i in items if i['id'] in previous))
+    )
+    HISTORY_COMMENTS.invalidate(*previous)
+    ABONNEMENT_CONTROL.schedule(*(i['id'] for i in items))
+    if error is not None:
+        raise HTTPException(status_code=502, detail=f'Appointments {list(error.errors)} were not updated.')
     return result
 
 
+def rollback_target(id: int, snapshot: dict | None) -> Appointment:
+    """Состояние из истории, в которое откатывается занятие. Неполная запись - 409, а не 500."""
+    try:
+        return Appointment.model_validate(snapshot or {})
+    except ValidationError:
+        raise HTTPException(status_code=409, detail=f'Appointment id={id} history entry is incomplete, cannot roll back.')
+
+
 @router.put("/rollback/{id}", status_code=200)
-async def rollback_appointment(id: int, bt: BackgroundTasks) -> BXAppointment:
-    """Откатывает изменения занятия на 1 шаг назад"""
+async def rollback_appointment(id: int, bt: BackgroundTasks, steps: int = Query(1, ge=1)) -> BXAppointment:
+    """
+    Откатывает изменения занятия на steps шагов назад: сначала по локальной истории,
+    дальше - по комментам history; в битре, куда историю писали до локальной истории.
+    """
     aety = BXConstants.appointment.entityTypeId
-    data, comments = await asyncio.gather(
-        BitrixClient.get_crm_item(aety, id),
-        BitrixClient.get_comments_list(id)
+    entries = await HISTORY.latest(id, steps)
+    comments = []
+    if len(entries) < steps:
+        data, all_comments = await asyncio.gather(
+            BitrixClient.get_crm_item(aety, id),
+            BitrixClient.get_comments_list(id)
+        )
+        if data is None:
+            raise HTTPException(status_code=404, detail=f"Appointment id={id} not found.")
+        comments = [c for c in all_comments if c.get('COMMENT', '').startswith('history;')]
+        available = len(entries) + len(comments)
+        if not available:
+            return BXAppointment.model_validate(data)
+        if steps > available:
+            raise HTTPException(
+                status_code=409,
+                detail=f'Appointment id={id} has only {available} steps of history, cannot roll back {steps}.'
+            )
+        snapshot = BXAppointment.parse_history_comment(comments[steps - len(entries) - 1]['COMMENT'])
+    else:
+        snapshot = entries[-1][1]
+    target = rollback_target(id, snapshot)
+    data = await BitrixClient.update_crm_item(aety, id, target.to_bx())
+    await asyncio.gather(
+        MIRROR.save_appointments(data),
+        HISTORY.revert(id, *(seq for seq, _ in entries)),
+        *(BitrixClient.delete_comment(c) for c in comments[:steps - len(entries)])
     )
+    HISTORY_COMMENTS.invalidate(id)
     appointment = BXAppointment.model_validate(data)
-    appointment.parse_last_comment(comments)
-    if len(comments) > 0:
-        previous = Appointment(
-            specialist=appointment.old_specialist,
-            patient=appointment.old_patient,
-            start=appointment.old_start,
-            end=appointment.old_end,
-            code=appointment.old_code,
-            status=appointment.old_status
-        )
-        fields = previous.to_bx()
-        updated_data = await BitrixClient.update_crm_item(aety, id, fields)
-        appointment = BXAppointment.model_validate(updated_data)
-        comment = comments.pop(0)
-        await BitrixClient.delete_comment(comment)
-        appointment.parse_last_comment(comments)
-    asyncio.create_task(BitrixClient.run_abonnement_control(id))
+    await fill_previous(appointment)
+    bt.add_task(logger.debug, f'Appointment id={id} was rolled back.')
+    ABONNEMENT_CONTROL.schedule(id)
     return appointment
 
 
@@ -173,6 +209,8 @@ async def delete_appointment(id: int, bt: BackgroundTasks):
     result = await BitrixClient.delete_crm_item(aety, id)
     if not result:
         raise HTTPException(404, f'Appointment id={id} not found.')
+    await MIRROR.delete_appointments(id)
+    HISTORY_COMMENTS.invalidate(id)
     bt.add_task(logger.debug, f'Appointment id={id} was deleted.')
 
 
@@ -187,7 +225,10 @@ async def delete_appointment_massive(id: int, bt: BackgroundTasks) -> list[BXApp
     )
     response = []
     batches = {}
-    builder = BatchBuilder("crm.item.delete")
+    command = BatchBuilder(
+        "crm.item.delete",
+        {"entityTypeId": BXConstants.appointment.entityTypeId}
+    ).compile('id')
     for raw in appointments:
         appointment = BXAppointment.model_validate(raw)
         is_patient = template.patient == appointment.patient
@@ -203,11 +244,11 @@ async def delete_appointment_massive(id: int, bt: BackgroundTasks) -> list[BXApp
         )
         if template_start != app_start:
             continue
-        builder.params = {
-            "entityTypeId": BXConstants.appointment.entityTypeId, 
-            "id": appointment.id
-        }
-        batches[appointment.id] = builder.build()
+        batches[appointment.id] = command.build(id=appointment.id)
         response.append(appointment)
-    await BitrixClient.call_batch(batches)
-    return response
+    result = await BitrixClient.execute_batch(batches)
+    if not result.ok:
+        bt.add_task(logger.warning, f'Massive delete: appointments {list(result.failed)} were not deleted.')
+    await MIRROR.delete_appointments(*result.successes)
+    HISTORY_COMMENTS.invalidate(*result.successes)
+    return [a for a in response if a.id in result.successes]
@@ -1,52 +1,293 @@
-from fastapi import APIRouter, Depends
-from src.utils import extract
+import asyncio
+import json
+from datetime import date, timedelta
 
-from src.core import BitrixClient, BXConstants
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.exceptions import HTTPException
+from fastapi.responses import StreamingResponse
+from src.utils import extract, make_etag, items_etag, not_modified, wants_columnar, columnar_response
+
+from src.core import Settings, BXConstants, SINGLE_FLIGHT, LOADER, SCHEDULER
+from src.services import MIRROR, BROKER, SPECIALISTS, CLIENTS, ABONNEMENT_CONTROL, HISTORY, fill_previous
 from src.schemas.api import (
     BXSpecialist, 
     BXClient, 
+    ClientsPage,
+    ClientsQuery,
     QueryDateRange,
+    parse_datetime,
+    ChangesQuery,
+    Changes,
+    DeletedIds,
     BXAppointment,
-    BXSchedule
+    BXSchedule,
+    ViewDay,
+    ViewSpecialist,
+    View,
+    FreeSlotsQuery,
+    FreeSlot
 )
+from src.appointplan.handler.free_time import FREE_TIME
+from .production_calendar import holidays_between
 
 
 router = APIRouter(prefix="")
 
+# Поля занятий, которые в колоночном формате кодируются индексами в словарях
+APPOINTMENT_DICTIONARIES = {'code': ('code', 'old_code'), 'status': ('status', 'old_status')}
+# Значения для истории, совпадающие с текущими, в колоночном формате передаются как null
+APPOINTMENT_SAME_AS = {f'old_{field}': field for field in ('specialist', 'patient', 'start', 'end', 'code', 'status')}
+
+
+async def parse_appointments(appointments: list[dict]) -> list[BXAppointment]:
+    """Валидные занятия из данных битры с заполненными значениями для истории"""
+    bx_appintments = map(lambda a: BXAppointment.model_validate(a), appointments)
+    result = list(filter(lambda a: a.is_valid(), bx_appintments))
+    await fill_previous(*result)
+    return result
+
+
+def parse_schedules(schedules: list[dict]) -> list[BXSchedule]:
+    """Валидные графики из данных битры"""
+    bx_schedules = map(lambda s: BXSchedule.model_validate(s), schedules)
+    return list(filter(lambda s: s.is_valid(), bx_schedules))
+
+
+async def filter_specialists(
+    specialist_ids: list[int] | None = Query(None),
+    department: list[str] | None = Query(None)
+) -> list[int] | None:
+    """
+    Зависимость для фильтра по специалистам: id специалистов и/или подразделения (код или id из BXConstants.departments).
+    Если заданы оба - пересечение. None - фильтра нет.
+    """
+    if department is None:
+        return None if specialist_ids is None else sorted(set(specialist_ids))
+    codes = []
+    for value in department:
+        code = BXConstants.departments.get(value, value)
+        if code not in BXConstants.department_ids:
+            raise HTTPException(status_code=400, detail=f'Unknown department {value}.')
+        codes.append(code)
+    ids = {s.id for s in await SPECIALISTS.get_by_departments(codes)}
+    if specialist_ids is not None:
+        ids &= set(specialist_ids)
+    return sorted(ids)
+
+
+def local_date(value: str, exclusive: bool = False) -> date:
+    """
+    День в часовом поясе портала: 2025-07-06T21:00:00.000Z -> 2025-07-07.
+    exclusive - value это не включаемый конец периода, берется день перед ним: 2025-07-09T21:00:00.000Z -> 2025-07-09
+    """
+    moment = parse_datetime(value)
+    if exclusive:
+        moment -= timedelta(microseconds=1)
+    return moment.astimezone(Settings.TIMEZONE).date()
+
 
 @router.get("/get_specialist", status_code=200)
-async def get_specialists() -> list[BXSpecialist]:
+async def get_specialists(request: Request, response: Response) -> list[BXSpecialist]:
     """Получение списка специалистов из Bitrix."""
-    return await BitrixClient.get_all_specialist()
+    specialists = await SPECIALISTS.all()
+    return not_modified(request, response, make_etag('specialists', SPECIALISTS.version)) or specialists
 
 
 @router.get("/get_clients", status_code=200)
-async def get_clients() -> list[BXClient]:
+async def get_clients(request: Request, response: Response) -> list[BXClient]:
     """Получение списка клиентов из Bitrix CRM."""
-    clients = await BitrixClient.get_all_clients()
-    return [BXClient.model_validate(c) for c in clients]
+    clients = await CLIENTS.all()
+    return not_modified(request, response, make_etag('clients', CLIENTS.version)) or clients
+
+
+@router.get("/clients/search", status_code=200)
+async def search_clients(query: ClientsQuery = Depends()) -> ClientsPage:
+    """Поиск клиентов по началу имени или фамилии с пагинацией."""
+    items, total = await CLIENTS.search(query.q, query.offset, query.limit)
+    return ClientsPage(total=total, items=items)
 
 
 @router.get("/get_schedules", status_code=200)
-async def get_schedules(query: QueryDateRange = Depends()) -> list[BXAppointment]:
-    """Получение расписания записей специалистов за указанный период."""
-    appointments = await BitrixClient.get_all_appointments(query.start, query.end)
-    bx_appintments = map(lambda a: BXAppointment.model_validate(a), appointments)
-    response = list(filter(lambda a: a.is_valid(), bx_appintments))
-    comments = await BitrixClient.get_comments_from_appointments_by_id(a.id for a in response)
-    # print('[DEBUG]', len(response), len(comments))
-    comment_values = (v for v in comments.values())
-    for appointment, comment in zip(response, comment_values):
-        appointment.parse_last_comment(comment)
-    return response
+async def get_schedules(
+    request: Request,
+    response: Response,
+    query: QueryDateRange = Depends(),
+    specialists: list[int] | None = Depends(filter_specialists)
+) -> list[BXAppointment]:
+    """
+    Получение расписания записей специалистов за указанный период.
+    specialist_ids и department ограничивают специалистов, фильтр уходит в зеркало или в запрос к битре.
+    Пока зеркало синхронизировано, ETag считается по его версии и запрос 304 не читает данные вовсе.
+    С Accept: application/vnd.appointplan.columnar+json ответ колоночный: по массиву на поле,
+    code и status - индексы в словарях dictionaries.code и dictionaries.status,
+    null в old_* - значение для истории совпадает с текущим.
+    """
+    aety = BXConstants.appointment.entityTypeId
+    columnar = wants_columnar(request)
+    response.headers['Vary'] = 'Accept'
+    if MIRROR.ready:
+        etag = make_etag(
+            'appointments', MIRROR.versions[aety], HISTORY.version, query.start, query.end, specialists, columnar
+        )
+        if (cached := not_modified(request, response, etag)) is not None:
+            return cached
+    response.headers['X-Changes-Cursor'] = await MIRROR.get_cursor()
+    appointments = await MIRROR.get_appointments(query.start, query.end, specialists)
+    if not MIRROR.ready:
+        etag = items_etag(appointments, 'appointments', HISTORY.version, query.start, query.end, specialists, columnar)
+        if (cached := not_modified(request, response, etag)) is not None:
+            return cached
+    result = await parse_appointments(appointments)
+    if columnar:
+        return columnar_response(result, APPOINTMENT_DICTIONARIES, APPOINTMENT_SAME_AS, dict(response.headers))
+    return result
 
 
 @router.get("/get_work_schedules", status_code=200)
-async def get_work_schedules(query: QueryDateRange = Depends()) -> list[BXSchedule]:
-    schedules = await BitrixClient.get_all_schedules(query.start, query.end)
-    bx_schedules = map(lambda s: BXSchedule.model_validate(s), schedules)
-    filtered = filter(lambda s: s.is_valid(), bx_schedules)
-    return list(filtered)
+async def get_work_schedules(
+    request: Request,
+    response: Response,
+    query: QueryDateRange = Depends(),
+    specialists: list[int] | None = Depends(filter_specialists)
+) -> list[BXSchedule]:
+    seti = BXConstants.schedule.entityTypeId
+    if MIRROR.ready:
+        etag = make_etag('schedules', MIRROR.versions[seti], query.start, query.end, specialists)
+        if (cached := not_modified(request, response, etag)) is not None:
+            return cached
+    response.headers['X-Changes-Cursor'] = await MIRROR.get_cursor()
+    schedules = await MIRROR.get_schedules(query.start, query.end, specialists)
+    if not MIRROR.ready:
+        etag = items_etag(schedules, 'schedules', query.start, query.end, specialists)
+        if (cached := not_modified(request, response, etag)) is not None:
+            return cached
+    return parse_schedules(schedules)
+
+
+@router.get("/view", status_code=200)
+async def get_view(query: QueryDateRange = Depends()) -> View:
+    """
+    Все данные основной таблицы за период одним запросом: специалисты, клиенты, выходные,
+    графики и занятия, разложенные по специалистам и дням. Источники читаются одновременно.
+    Курсор для /changes и /stream берется до чтения, чтобы изменения во время чтения не потерялись.
+    """
+    cursor = await MIRROR.get_cursor()
+    specialists, clients, appointments, schedules, holidays = await asyncio.gather(
+        SPECIALISTS.all(),
+        CLIENTS.all(),
+        MIRROR.get_appointments(query.start, query.end),
+        MIRROR.get_schedules(query.start, query.end),
+        holidays_between(local_date(query.start), local_date(query.end, exclusive=True))
+    )
+    rows = {s.id: ViewSpecialist(id=s.id, specialist=s) for s in specialists}
+    days: dict[tuple[int, date], ViewDay] = {}
+    weekends = set(holidays)
+
+    def get_day(specialist: int, value: str) -> ViewDay:
+        key = (specialist, local_date(value))
+        if key not in days:
+            days[key] = ViewDay(date=key[1], holiday=key[1] in weekends)
+            rows.setdefault(specialist, ViewSpecialist(id=specialist)).days.append(days[key])
+        return days[key]
+
+    for schedule in parse_schedules(schedules):
+        get_day(schedule.specialist, schedule.date).schedules.append(schedule)
+    for appointment in await parse_appointments(appointments):
+        get_day(appointment.specialist, appointment.start).appointments.append(appointment)
+    for row in rows.values():
+        row.days.sort(key=lambda d: d.date)
+    return View(cursor=cursor, holidays=holidays, clients=clients, specialists=list(rows.values()))
+
+
+@router.get("/free_slots", status_code=200)
+async def get_free_slots(
+    query: FreeSlotsQuery = Depends(),
+    specialists: list[int] | None = Depends(filter_specialists)
+) -> list[FreeSlot]:
+    """
+    Первые limit свободных слотов длительностью duration минут у специалистов department / specialist_ids
+    в периоде, с time_from до time_to внутри дня. Слоты нарезаются так же, как у планировщика.
+    """
+    infos = await SPECIALISTS.all()
+    if specialists is not None:
+        selected = set(specialists)
+        infos = [s for s in infos if s.id in selected]
+    slots = await FREE_TIME.find(
+        infos,
+        parse_datetime(query.start),
+        parse_datetime(query.end),
+        timedelta(minutes=query.duration),
+        query.time_from,
+        query.time_to,
+        query.limit
+    )
+    return [FreeSlot(specialist=id, start=interval.start, end=interval.end) for id, interval in slots]
+
+
+@router.get("/changes", status_code=200)
+async def get_changes(query: ChangesQuery = Depends()) -> Changes:
+    """
+    Занятия и графики периода, созданные, измененные или удаленные после курсора since.
+    Начальный курсор приходит в заголовке X-Changes-Cursor ответов get_schedules и get_work_schedules.
+    Если журнал после since уже очищен или курсор от прежней базы зеркала - 410, период нужно загрузить заново.
+    """
+    changes = await MIRROR.get_changes(query.since, query.start, query.end)
+    if changes is None:
+        raise HTTPException(status_code=410, detail=f'Changes cursor {query.since} is expired.')
+    cursor, items, deleted = changes
+    aety, seti = BXConstants.appointment.entityTypeId, BXConstants.schedule.entityTypeId
+    appointments, schedules = [], []
+    removed = DeletedIds(appointments=deleted[aety], schedules=deleted[seti])
+    for raw in items[aety]:
+        appointment = BXAppointment.model_validate(raw)
+        if appointment.is_valid():
+            appointments.append(appointment)
+        else:
+            removed.appointments.append(appointment.id)
+    for raw in items[seti]:
+        schedule = BXSchedule.model_validate(raw)
+        if schedule.is_valid():
+            schedules.append(schedule)
+        else:
+            removed.schedules.append(schedule.id)
+    await fill_previous(*appointments)
+    return Changes(cursor=cursor, appointments=appointments, schedules=schedules, deleted=removed)
+
+
+@router.get("/stream", status_code=200)
+async def stream_changes(
+    request: Request,
+    query: QueryDateRange = Depends(),
+    specialists: list[int] | None = Depends(filter_specialists)
+) -> StreamingResponse:
+    """
+    Поток Server-Sent Events об изменениях занятий и графиков периода (и специалистов по specialist_ids и department).
+    event: change - {cursor, entity, id, action}, сами данные дочитываются через /changes с прежним курсором.
+    event: reset - клиент не успевал читать и события потеряны, период нужно загрузить заново.
+    """
+    subscription = MIRROR.subscribe(query.start, query.end, specialists)
+
+    async def events():
+        try:
+            yield f"event: open\ndata: {json.dumps({'cursor': await MIRROR.get_cursor()})}\n\n"
+            while not await request.is_disconnected():
+                if subscription.overflow:
+                    yield "event: reset\ndata: {}\n\n"
+                    return
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), Settings.STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: change\ndata: {json.dumps(message, separators=(',', ':'))}\n\n"
+        finally:
+            BROKER.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 
 @router.get("/get_constants", status_code=200)
@@ -62,3 +303,16 @@ async def get_constants() -> dict:
         elif isinstance(value, dict):
             bx_dict[key] = value
     return bx_dict
+
+
+@router.get("/get_stats", status_code=200)
+async def get_stats() -> dict:
+    """Счетчики работы кэшей и очередей запросов к битре."""
+    return {
+        'single_flight': SINGLE_FLIGHT.stats(),
+        'loader': LOADER.stats(),
+        'scheduler': SCHEDULER.stats(),
+        'abonnement_control': ABONNEMENT_CONTROL.stats(),
+        'stream': BROKER.stats(),
+        'free_time': FREE_TIME.stats()
+    }
@@ -2,10 +2,11 @@ from fastapi import APIRouter, BackgroundTasks
 from fastapi.exceptions import HTTPException
 from datetime import datetime, timedelta
 
-from src.core import BXConstants, BitrixClient, Settings
+from src.core import BXConstants, BitrixClient, Settings, BatchError
 from src.schemas.api import Schedule, BXSchedule
 from src.logger import logger
-from src.utils import BatchBuilder, Interval
+from src.services import MIRROR
+from src.utils import BatchBuilder, Interval, batch_items
 
 from .service import create_schedule_massive as _create_schedule_massive
 
@@ -20,6 +21,7 @@ async def create_schedule(schedule: Schedule, bt: BackgroundTasks) -> Schedule :
     seti = BXConstants.schedule.entityTypeId
     fields = schedule.to_bx()
     data = await BitrixClient.create_crm_item(seti, fields)
+    await MIRROR.save_schedules(data)
     schedule.id = data['id']
     bt.add_task(logger.debug, f'Schedule id={schedule.id} was created.')
     return schedule
@@ -47,6 +49,7 @@ async def update_schedule(id: int, schedule: Schedule, bt: BackgroundTasks) -> S
     seti = BXConstants.schedule.entityTypeId
     fields = schedule.to_bx()
     updated_data = await BitrixClient.update_crm_item(seti, id, fields)
+    await MIRROR.save_schedules(updated_data)
     bt.add_task(logger.debug, f"Appointment id={id} was updated.")
     return schedule
 
@@ -62,7 +65,10 @@ async def update_schedule_massive(id: int, schedule: Schedule, bt: BackgroundTas
         (schedule.specialist, )
     )
     template = list(map(lambda i: Interval.from_js_timestamp(*(i.split(':'))), schedule.intervals))
-    builder = BatchBuilder('crm.item.update')
+    command = BatchBuilder(
+        'crm.item.update',
+        {"entityTypeId": BXConstants.schedule.entityTypeId}
+    ).compile('id', 'fields')
     batches = {}
     for s in schedules:
         schedule_date = s.get(BXConstants.schedule.uf.date, None)
@@ -87,17 +93,16 @@ async def update_schedule_massive(id: int, schedule: Schedule, bt: BackgroundTas
             interval_end = int(interval_end.timestamp()) * 1000
             schedule_intervals.append(f'{interval_start}:{interval_end}')
         fields = {BXConstants.schedule.uf.intervals: schedule_intervals}
-        builder.params = {
-            "entityTypeId": BXConstants.schedule.entityTypeId, 
-            "id": s.get('id'), 
-            "fields": fields
-        }
-        batches[s.get('id')] = builder.build()
-    result = await BitrixClient.call_batch(batches)
-    default = {}
-    if isinstance(result, list):
-        return result
-    return [BXSchedule.model_validate(i.get('item', default)) for i in result.values()]
+        batches[s.get('id')] = command.build(id=s.get('id'), fields=fields)
+    response = []
+    try:
+        async for part in BitrixClient.iter_batch(batches):
+            items = batch_items(part)
+            await MIRROR.save_schedules(*items)
+            response.extend(BXSchedule.model_validate(i) for i in items)
+    except BatchError as exc:
+        raise HTTPException(status_code=502, detail=f'Schedules {list(exc.errors)} were not updated.')
+    return response
 
 
 @router.delete("/{id}", status_code=204)
@@ -106,6 +111,7 @@ async def delete_schedule(id: int, bt: BackgroundTasks):
     result = await BitrixClient.delete_crm_item(seti, id)
     if not result:
         raise HTTPException(404, f'Schedule id={id} not found.')
+    await MIRROR.delete_schedules(id)
     bt.add_task(logger.debug, f'Schedule id={id} was deleted.')
 
 
@@ -1,43 +1,52 @@
 from src.schemas.api import Schedule, BXSchedule
 from datetime import datetime, timedelta, date
-from src.core import Settings, BitrixClient, BXConstants
-from src.utils import BatchBuilder
+from fastapi.exceptions import HTTPException
+from src.core import Settings, BitrixClient, BXConstants, BatchError
+from src.utils import BatchBuilder, batch_items
+from src.services import MIRROR
 import holidays
 import asyncio
 
 
 RU_HOLIDAYS = holidays.country_holidays('RU', years=[2025, 2026, 2027])
 
-get_params = lambda f: {"entityTypeId": BXConstants.schedule.entityTypeId, "fields": f}
-
-
 async def create_schedule_massive(schedule: Schedule) -> list[BXSchedule]:
     """Создает графики специалиста на 1 год по шаблону schedule."""
     date = datetime.fromisoformat(schedule.date).replace(tzinfo=Settings.TIMEZONE)
     existed_schedules = await get_schedules(schedule.specialist, date)
-    to_delete = set()
-    builder = BatchBuilder('crm.item.add')
+    replaced = {}
+    command = BatchBuilder('crm.item.add', {"entityTypeId": BXConstants.schedule.entityTypeId}).compile('fields')
     batches = {}
     intervals = list(map(lambda x: list(map(int, x.split(':'))), schedule.intervals))
     for q in range(52):
         if date not in RU_HOLIDAYS:
             existed_schedule = existed_schedules.get(date.date(), None)
             if existed_schedule is not None:
-                to_delete |= existed_schedule
+                replaced[f'batch{q}'] = existed_schedule
             s = Schedule(
                 specialist=schedule.specialist,
                 date=date.isoformat(),
                 intervals=[':'.join(map(str, i)) for i in intervals]
             )
-            builder.params = get_params(s.to_bx())
-            batches[f'batch{q}'] = builder.build()
+            batches[f'batch{q}'] = command.build(fields=s.to_bx())
         date = date + timedelta(weeks=1)
         for interval in intervals:
             interval[0] += 604800000
             interval[1] += 604800000
-    response: dict[str, dict] = await BitrixClient.call_batch(batches)
+    error = None
+    try:
+        response: dict[str, dict] = await BitrixClient.call_batch(batches)
+    except BatchError as exc:
+        response, error = exc.successes, exc
+    await MIRROR.save_schedules(*batch_items(response))
     result = [BXSchedule.model_validate(i.get('item', {})) for i in response.values()]
+    # Старые графики удаляются только за дни, на которые новые создались
+    to_delete = set()
+    for key in response:
+        to_delete |= replaced.get(key, set())
     asyncio.create_task(delete_schedules(to_delete))
+    if error is not None:
+        raise HTTPException(status_code=502, detail=f'{len(error.errors)} of {len(batches)} schedules were not created.')
     return result
 
 
@@ -61,4 +70,5 @@ async def delete_schedules(schedule_ids: set[str | int]) -> None:
     """Удаление существующих графиков."""
     seti = BXConstants.schedule.entityTypeId
     for _id in schedule_ids:
-        await BitrixClient.delete_crm_item(seti, _id)
+        if await BitrixClient.delete_crm_item(seti, _id):
+            await MIRROR.delete_schedules(_id)
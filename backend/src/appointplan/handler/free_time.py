@@ -0,0 +1,124 @@
+from datetime import date, datetime, time, timedelta
+from time import monotonic
+
+from src.core import Settings
+from src.services import MIRROR, BROKER
+from src.schemas.api import BXSpecialist
+from src.schemas.appointplan import BXSchedule, BXAppointment
+from src.utils import Interval
+from .service import Department, Specialist
+
+
+class FreeTimeIndex:
+    """
+    Кэш свободного времени специалистов по дням: графики за вычетом занятий, как у планировщика.
+    Специалист сбрасывается из кэша, когда в зеркале меняются его графики или занятия, и по ttl.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._days: dict[int, dict[date, list[Interval]]] = {}     # {id специалиста: {день: свободные интервалы}}
+        self._loaded: dict[int, float] = {}                         # {id специалиста: когда загружен}
+        self._generation = 0                                        # Растет при каждом сбросе
+
+    def _expired(self, id: int, now: float) -> bool:
+        return id not in self._loaded or now - self._loaded[id] > self.ttl
+
+    def _covers(self, id: int, days: list[date], now: float) -> bool:
+        cached = self._days.get(id, {})
+        return not self._expired(id, now) and all(day in cached for day in days)
+
+    async def _load(self, specialists: list[BXSpecialist], first: date, last: date) -> dict[int, dict]:
+        """
+        Строит свободное время специалистов за дни first..last.
+        Если во время загрузки что-то сбросилось, результат не кэшируется - он мог устареть.
+        """
+        generation = self._generation
+        start = datetime.combine(first, time.min, Settings.TIMEZONE).isoformat()
+        end = datetime.combine(last + timedelta(days=1), time.min, Settings.TIMEZONE).isoformat()
+        ids = [s.id for s in specialists]
+        by_id = {s.id: Specialist(s) for s in specialists}
+        schedules = [BXSchedule(**s) for s in await MIRROR.get_schedules(start, end, ids)]
+        appointments = [BXAppointment(**a) for a in await MIRROR.get_appointments(start, end, ids)]
+        for schedule in sorted(filter(BXSchedule.is_valid, schedules), key=lambda s: s.date):
+            if schedule.specialist in by_id:
+                by_id[schedule.specialist].schedules.append(schedule)
+        for appointment in sorted(filter(BXAppointment.is_valid, appointments), key=lambda a: a.start):
+            if appointment.specialist in by_id:
+                by_id[appointment.specialist].appointments.append(appointment)
+        now = monotonic()
+        loaded = {}
+        for id, specialist in by_id.items():
+            specialist.rebuild_map()
+            loaded[id] = {
+                first + timedelta(days=i): list(specialist.map.get(first + timedelta(days=i), ()))
+                for i in range((last - first).days + 1)
+            }
+            if generation != self._generation:
+                continue
+            if self._expired(id, now):
+                self._days.pop(id, None)
+            self._days.setdefault(id, {}).update(loaded[id])
+            self._loaded[id] = now
+        return loaded
+
+    async def find(
+        self,
+        specialists: list[BXSpecialist],
+        start: datetime,
+        end: datetime,
+        duration: timedelta,
+        time_from: time | None = None,
+        time_to: time | None = None,
+        limit: int = 20
+    ) -> list[tuple[int, Interval]]:
+        """Первые limit свободных слотов длительностью duration в периоде: [(id специалиста, интервал)]"""
+        start, end = start.astimezone(Settings.TIMEZONE), end.astimezone(Settings.TIMEZONE)
+        first, last = start.date(), end.date()
+        days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+        now = monotonic()
+        missing = [s for s in specialists if not self._covers(s.id, days, now)]
+        self.hits += len(specialists) - len(missing)
+        self.misses += len(missing)
+        loaded = await self._load(missing, first, last) if missing else {}
+        department = Department()
+        for info in specialists:
+            specialist = Specialist(info)
+            cached = loaded.get(info.id) or self._days.get(info.id, {})
+            specialist.map = {day: cached[day] for day in days if cached.get(day)}
+            department.specialists.append(specialist)
+        result = []
+        for slots_of_day in department.get_slots(start, duration):
+            found = []
+            for slot in slots_of_day:
+                for interval in slot.intervals:
+                    if interval.end > end:
+                        continue
+                    if time_from is not None and interval.start.astimezone(Settings.TIMEZONE).time() < time_from:
+                        continue
+                    if time_to is not None and interval.end.astimezone(Settings.TIMEZONE).time() > time_to:
+                        continue
+                    found.append((slot.specialist.id, interval))
+            found.sort(key=lambda f: (f[1].start, f[0]))
+            result.extend(found)
+            if len(result) >= limit:
+                break
+        return result[:limit]
+
+    def invalidate(self, events: list[dict]):
+        """Сбрасывает специалистов, у которых изменились графики или занятия"""
+        self._generation += 1
+        for event in events:
+            for specialist, _, _ in event['positions']:
+                if specialist is not None:
+                    self._days.pop(int(specialist), None)
+                    self._loaded.pop(int(specialist), None)
+
+    def stats(self) -> dict:
+        return {'specialists': len(self._days), 'hits': self.hits, 'misses': self.misses}
+
+
+FREE_TIME = FreeTimeIndex(Settings.FREE_TIME_TTL)
+BROKER.listen(FREE_TIME.invalidate)
@@ -3,8 +3,9 @@ import asyncio
 import json
 from datetime import datetime, timedelta, time
 
-from src.core import Settings, BitrixClient, BXConstants
+from src.core import Settings, BitrixClient, BXConstants, BatchError, Lane, CURRENT_LANE
 from src.logger import logger
+from src.services import SPECIALISTS, CLIENTS
 from src.middleware import AppExceptionHandlerMiddleware as AEHM
 from .service import AppointplanException
 from src.schemas.appointplan import Stage, AppointmentSet, Deal
@@ -28,6 +29,7 @@ class Handler:
 
     async def run(self):
         """Проставляем занятия и отправляем сообщение. Обернуто в транзакцию."""
+        CURRENT_LANE.set(Lane.BACKGROUND)
         try:
             context = Context(self)
             await context.fill()
@@ -45,9 +47,10 @@ class Handler:
             trace_format = traceback.format_exc()
             AEHM._log_app_exception(stack, trace_format)
             self.appointments.clear()
+        appointments = await self.send_appointments()
         asyncio.create_task(self.send_message())
         asyncio.create_task(self.send_comment())
-        return await self.send_appointments()
+        return appointments
 
     def plan_appointments(self, stage: Stage, app_set: AppointmentSet):
         """
@@ -141,6 +144,10 @@ class Handler:
     async def send_appointments(self):
         """Посылает батч-запрос на расстановку занятий в битру."""
         if self.appointments:
+            command = BatchBuilder(
+                'crm.item.add',
+                {'entityTypeId': BXConstants.appointment.entityTypeId}
+            ).compile('fields')
             batches = {}
             for index, appointment in enumerate(self.appointments):
                 fields = {
@@ -152,33 +159,33 @@ class Handler:
                     'ufCrm3Dealid': self.deal.id,
                     'ufCrm3Status': 51
                 }
-                params = {'entityTypeId': BXConstants.appointment.entityTypeId, 'fields': fields}
-                batches[index] = BatchBuilder('crm.item.add', params).build()
-            result = await BitrixClient.call_batch(batches)
-            logger.info('The appointments were scheduled.')
-            for index, item in enumerate(result):
-                id = item.get('item', {}).get('id', None)
-                if id is not None:
-                    self.appointments[index].id = id
+                batches[index] = command.build(fields=fields)
+            try:
+                async for part in BitrixClient.iter_batch(batches):
+                    for index, item in part.items():
+                        id = (item or {}).get('item', {}).get('id', None)
+                        if id is not None:
+                            self.appointments[index].id = id
+            except BatchError as exc:
+                # В сообщении и комменте остаются только созданные занятия
+                self.message = f'Не удалось создать {len(exc.errors)} из {len(batches)} занятий.'
+                logger.error(f'{self.message} {exc.errors}')
+                self.appointments = [a for i, a in enumerate(self.appointments) if i not in exc.errors]
+            else:
+                logger.info('The appointments were scheduled.')
         return self.appointments
 
     async def send_comment(self):
         if not self.appointments:
             return
-        specialists_lst, patients_lst = await asyncio.gather(
-            BitrixClient.get_all_specialist(),
-            BitrixClient.get_all_clients()
+        _, client = await asyncio.gather(
+            SPECIALISTS.ensure(),
+            CLIENTS.get(self.deal.patient)
         )
-        specialists = {s.id: s for s in specialists_lst}
+        specialists = SPECIALISTS.by_id
         patient = str(self.deal.patient)
-        for c in patients_lst:
-            if c.get('ID', '0') == patient:
-                patient = c
-                break
-        if isinstance(patient, dict):
-            last_name = patient.get('LAST_NAME', None) or ""
-            name = patient.get('NAME', '')[0] or ""
-            patient = last_name + ' ' + name       # type:ignore
+        if client is not None:
+            patient = f'{client.last_name} {client.name[:1]}'
 
         def iterator():
             template = "[*] {0} - {1}, {2}, {3}, {4} минут."
@@ -277,11 +284,8 @@ class Context:
     async def get_specialist_info(self, types: set) -> list[BXSpecialist]:
         """Получает инфу о специалистах"""
         types = types.copy()
-        bx_specialists = await BitrixClient.get_specialists_by_department(types)
-        specialists = []
-        for spec in bx_specialists:
-            bxspec = BXSpecialist(**spec)
-            specialists.append(bxspec)
+        specialists = await SPECIALISTS.get_by_departments(types)
+        for bxspec in specialists:
             types -= set(bxspec.departments)  # вычитаем из множества другое множество на месте
         if len(types) > 0:
             raise AppointplanException(f'Не найден специалист для подразделений {types}.')
@@ -1,3 +1,5 @@
 from .settings import Settings
 from .bxconstants import BXConstants
-from .bitrix import BitrixClient
+from .bitrix import BitrixClient, SINGLE_FLIGHT, LOADER, SCHEDULER
+from .batch import BatchResult, BatchError
+from .scheduler import Lane, CURRENT_LANE
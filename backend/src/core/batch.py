@@ -0,0 +1,223 @@
+import asyncio
+from time import perf_counter
+from typing import AsyncGenerator
+
+from fast_bitrix24 import BitrixAsync
+from fast_bitrix24.server_response import ErrorInServerResponseException
+from loguru import logger
+
+
+# Накладные расходы на одну команду в теле запроса: "cmd[", "]", кавычки, разделители
+_COMMAND_OVERHEAD = 16
+
+# Ошибки команд, которые имеет смысл повторить: лимиты и временные сбои портала
+RETRYABLE_ERRORS = frozenset({
+    'QUERY_LIMIT_EXCEEDED',
+    'OPERATION_TIME_LIMIT',
+    'INTERNAL_SERVER_ERROR',
+    'ERROR_UNEXPECTED_ANSWER',
+    'TRANSPORT_ERROR',
+})
+# Команда отклонена до выполнения - повторять можно любой метод
+REJECTED_ERRORS = frozenset({'QUERY_LIMIT_EXCEEDED'})
+# Методы, повторное выполнение которых ничего не дублирует
+IDEMPOTENT_SUFFIXES = ('.get', '.list', '.update', '.delete')
+
+
+def command_size(key, command: str) -> int:
+    """Сколько байт команда займет в теле батч запроса"""
+    return len(str(key).encode()) + len(command.encode()) + _COMMAND_OVERHEAD
+
+
+def split_commands(cmd: dict, max_commands: int, max_bytes: int | None = None) -> list[dict]:
+    """
+    Раскладывает команды по порциям с сохранением порядка: в порции не больше max_commands команд
+    и не больше max_bytes байт. Команда больше max_bytes уходит отдельной порцией.
+    """
+    chunks, chunk, size = [], {}, 0
+    for key, command in cmd.items():
+        length = command_size(key, command) if max_bytes else 0
+        if chunk and (len(chunk) == max_commands or (max_bytes and size + length > max_bytes)):
+            chunks.append(chunk)
+            chunk, size = {}, 0
+        chunk[key] = command
+        size += length
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+class BatchResult:
+    """Результат батч запроса по ключам команд"""
+
+    __slots__ = ('successes', 'errors', 'retryable')
+
+    def __init__(self):
+        self.successes: dict = {}           # {ключ: результат} в порядке команд
+        self.errors: dict[object, dict] = {}       # Ошибки, которые повторять бесполезно
+        self.retryable: dict[object, dict] = {}    # Временные ошибки, оставшиеся после всех повторов
+
+    @property
+    def failed(self) -> dict[object, dict]:
+        """Все неудачные команды: {ключ: {'error': ..., 'error_description': ...}}"""
+        return self.errors | self.retryable
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors and not self.retryable
+
+
+def is_idempotent(command: str) -> bool:
+    """Команда вида crm.item.update?... - метод можно выполнить повторно"""
+    return command.split('?', 1)[0].endswith(IDEMPOTENT_SUFFIXES)
+
+
+def is_retryable(error: dict, command: str = '') -> bool:
+    """
+    Отклоненную по лимиту команду повторяем всегда. Остальные временные ошибки - только у идемпотентных методов:
+    add или bizproc.workflow.start могли уже выполниться на портале, повтор создаст дубль.
+    """
+    code = error.get('error', '')
+    if code in REJECTED_ERRORS:
+        return True
+    return code in RETRYABLE_ERRORS and is_idempotent(command)
+
+
+class BatchError(ErrorInServerResponseException):
+    """Часть команд батча не выполнилась. errors - {ключ: ошибка}, successes - выполненные команды."""
+
+    def __init__(self, errors: dict, successes: dict | list):
+        super().__init__(errors)
+        self.errors = errors
+        self.successes = successes
+
+
+class BatchExecutor:
+    """
+    Выполняет батч запрос порциями, отправляя порции параллельно.
+    Команды, упавшие с временной ошибкой, повторяются отдельно от остальных с нарастающей паузой
+    (неидемпотентные - только если битра отклонила их по лимиту).
+    """
+
+    __slots__ = (
+        'bitrix', 'batch_size', 'max_bytes', 'concurrency', 'retries', 'backoff',
+        'latencies', 'is_list', 'result'
+    )
+
+    def __init__(
+            self,
+            bitrix: BitrixAsync,
+            batch_size: int,
+            concurrency: int,
+            max_bytes: int | None = None,
+            retries: int = 0,
+            backoff: float = 0.5
+    ):
+        self.bitrix = bitrix
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.concurrency = max(concurrency, 1)
+        self.retries = max(retries, 0)
+        self.backoff = backoff                  # Пауза перед первым повтором, дальше удваивается, сек.
+        self.latencies: list[float] = []        # Время выполнения каждой порции, сек.
+        self.is_list = False                    # Битра ответила списком, а не словарем
+        self.result = BatchResult()
+
+    def split(self, cmd: dict) -> list[dict]:
+        """Разбивает команды на порции не больше batch_size штук и max_bytes байт"""
+        return split_commands(cmd, self.batch_size, self.max_bytes)
+
+    async def stream(self, cmd: dict) -> AsyncGenerator[dict]:
+        """
+        Отдает успешные результаты порций по мере их получения, в виде {ключ команды: результат}.
+        Одновременно в работе не больше concurrency порций, порядок порций не гарантирован.
+        Ошибки команд накапливаются в self.result.
+        """
+        chunks = self.split(cmd)
+        self.latencies = [0.0] * len(chunks)
+        self.is_list = False
+        self.result = BatchResult()
+        pending: dict[asyncio.Task, int] = {}
+        next_index = 0
+        try:
+            while next_index < len(chunks) or pending:
+                while next_index < len(chunks) and len(pending) < self.concurrency:
+                    task = asyncio.create_task(self._send(next_index, chunks[next_index]))
+                    pending[task] = next_index
+                    next_index += 1
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.pop(task)
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        if chunks:
+            latencies = ', '.join(f'{l:.3f}' for l in self.latencies)
+            logger.debug(f'Batch of {len(cmd)} commands sent in {len(chunks)} chunks. Latency, s: [{latencies}]')
+
+    async def execute(self, cmd: dict) -> BatchResult:
+        """Отправляет все порции и возвращает успешные результаты в порядке команд вместе с ошибками"""
+        successes = {}
+        async for part in self.stream(cmd):
+            successes.update(part)
+        self.result.successes = {key: successes[key] for key in cmd if key in successes}
+        return self.result
+
+    async def run(self, cmd: dict) -> list | dict:
+        """Отправляет все порции и возвращает успешные результаты. Если часть команд упала - BatchError."""
+        result = await self.execute(cmd)
+        successes = list(result.successes.values()) if self.is_list else result.successes
+        self.raise_for_errors(len(cmd), successes)
+        return successes
+
+    def raise_for_errors(self, total: int, successes: dict | list | None = None):
+        """Пишет ошибки команд последнего запроса в лог и бросает BatchError, если они есть"""
+        failed = self.result.failed
+        if not failed:
+            return
+        errors = '; '.join(f'{key}: {e.get("error")} {e.get("error_description", "")}' for key, e in failed.items())
+        logger.warning(f'Batch: {len(failed)} of {total} commands failed. {errors}')
+        raise BatchError(failed, self.result.successes if successes is None else successes)
+
+    async def _send(self, index: int, chunk: dict) -> dict:
+        """Отправляет порцию, повторяя только команды с временными ошибками"""
+        started = perf_counter()
+        successes, pending, failed = {}, chunk, {}
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                response = await self.bitrix.call('batch', {'halt': 0, 'cmd': pending}, raw=True)
+            except Exception as exc:
+                error = {'error': 'TRANSPORT_ERROR', 'error_description': f'{type(exc).__name__}: {exc}'}
+                failed = {key: error for key in pending}
+            else:
+                batch = (response or {}).get('result') or {}
+                successes.update(self._normalize(pending, batch.get('result')))
+                errors = batch.get('result_error') or {}
+                if not isinstance(errors, dict):
+                    errors = {}
+                failed = {key: errors[str(key)] for key in pending if str(key) in errors}
+            for key, error in failed.items():
+                if not is_retryable(error, pending[key]):
+                    self.result.errors[key] = error
+            pending = {key: pending[key] for key, error in failed.items() if is_retryable(error, pending[key])}
+            if not pending:
+                break
+        self.result.retryable.update({key: failed[key] for key in pending})
+        self.latencies[index] = perf_counter() - started
+        return successes
+
+    def _normalize(self, chunk: dict, result) -> dict:
+        """
+        Приводит результат порции к виду {ключ команды: результат}.
+        Ключи ответа битры (всегда строки) приводятся обратно к ключам команд.
+        Если битра хоть раз ответила списком - run вернет список.
+        """
+        if isinstance(result, list):
+            self.is_list = True
+            return dict(zip(chunk, result))
+        if isinstance(result, dict):
+            return {key: result[str(key)] for key in chunk if str(key) in result}
+        return {}
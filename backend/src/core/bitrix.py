@@ -1,18 +1,48 @@
-from typing import Iterable
+import asyncio
+from datetime import datetime, timedelta
+from typing import AsyncGenerator, Iterable
 from fast_bitrix24 import BitrixAsync
+from loguru import logger
 
 from .settings import Settings
 from .bxconstants import BXConstants
-from src.schemas.api import BXSpecialist
-from src.utils import BatchBuilder
+from .batch import BatchExecutor, BatchResult
+from .loader import BatchLoader, BitrixCommandError
+from .scheduler import RequestScheduler
+from src.schemas.api import BXSpecialist, BXAppointment, BXSchedule
+from src.utils import BatchBuilder, SingleFlight, get_select
 from aiocache import cached
 
 
-BITRIX = BitrixAsync(Settings.BITRIX_WEBHOOK, verbose=False)
+BITRIX = BitrixAsync(
+    Settings.BITRIX_WEBHOOK,
+    verbose=False,
+    request_pool_size=Settings.BITRIX_REQUEST_POOL,
+    requests_per_second=Settings.BITRIX_REQUESTS_PER_SECOND
+)
+
+# Раздает запросы к битре по приоритетам: фронт, изменения, фоновые задачи
+SCHEDULER = RequestScheduler(Settings.BITRIX_REQUESTS_PER_SECOND, Settings.BITRIX_REQUEST_POOL)
+SCHEDULER.attach(BITRIX)
+
+# Поля, которые запрашиваем в crm.item.list. Остальные поля элементов нам не нужны.
+APPOINTMENT_SELECT = get_select(BXAppointment, 'id', 'updatedTime', BXConstants.appointment.uf.deal_id)
+SCHEDULE_SELECT = get_select(BXSchedule, 'id', 'updatedTime')
+SELECT = {
+    BXConstants.appointment.entityTypeId: APPOINTMENT_SELECT,
+    BXConstants.schedule.entityTypeId: SCHEDULE_SELECT,
+}
+
+# Объединяет одинаковые одновременные запросы на чтение
+SINGLE_FLIGHT = SingleFlight()
+
+# Собирает одиночные чтения за один проход цикла событий в один батч
+LOADER = BatchLoader(BITRIX, 50, Settings.BATCH_MAX_BYTES)
 
 
 class BitrixClient:
     BATCH_SIZE = 50
+    HISTORY_IDS_CHUNK = 200         # Сколько занятий в одном фильтре по ENTITY_ID
 
     # Методы для приложения
     @staticmethod
@@ -22,29 +52,73 @@ class BitrixClient:
         return await BITRIX.get_all('crm.item.fields', params)
 
     @staticmethod
-    async def call_batch(cmd: dict) -> dict:
-        """Делает батч запрос"""
-        if len(cmd) <= BitrixClient.BATCH_SIZE:
-            return await BITRIX.call_batch(params={'halt': 0, 'cmd': cmd})
-        requests = []
-        dct = {}
-        for i, k in enumerate(cmd):
-            if i > 0 and i % BitrixClient.BATCH_SIZE == 0:
-                requests.append(dct)
-                dct = {}
-            dct[k] = cmd[k]
-        if dct:
-            requests.append(dct)
-        list_result, dict_result = [], {}
-        for request in requests:
-            middle_result = await BITRIX.call_batch({'halt': 0, 'cmd': request})
-            # print('[DEBUG]', middle_result)
-            if isinstance(middle_result, list):
-                list_result.extend(middle_result)
-            if isinstance(middle_result, dict):
-                dict_result |= middle_result
-        # print('[debug]', len(list_result), len(dict_result))
-        return list_result if list_result else dict_result
+    def get_batch_executor() -> BatchExecutor:
+        """Исполнитель батч запросов с настройками из Settings"""
+        return BatchExecutor(
+            BITRIX,
+            BitrixClient.BATCH_SIZE,
+            min(Settings.BATCH_CONCURRENCY, Settings.BITRIX_REQUEST_POOL),
+            Settings.BATCH_MAX_BYTES,
+            Settings.BATCH_RETRIES,
+            Settings.BATCH_RETRY_DELAY
+        )
+
+    @staticmethod
+    async def call_batch(cmd: dict) -> list | dict:
+        """
+        Делает батч запрос. Порции до BATCH_SIZE команд и BATCH_MAX_BYTES байт отправляются параллельно.
+        Возвращает результаты. Если часть команд упала - BatchError, выполненные команды в его successes.
+        """
+        return await BitrixClient.get_batch_executor().run(cmd)
+
+    @staticmethod
+    async def execute_batch(cmd: dict) -> BatchResult:
+        """Делает батч запрос и возвращает успешные результаты вместе с ошибками команд"""
+        return await BitrixClient.get_batch_executor().execute(cmd)
+
+    @staticmethod
+    async def iter_batch(cmd: dict) -> AsyncGenerator[dict]:
+        """
+        Делает батч запрос и отдает успешные результаты порций по мере получения: {ключ команды: результат}.
+        В памяти одновременно не больше BATCH_CONCURRENCY порций.
+        После всех порций, если часть команд упала - BatchError.
+        """
+        executor = BitrixClient.get_batch_executor()
+        async for part in executor.stream(cmd):
+            yield part
+        executor.raise_for_errors(len(cmd))
+
+    @staticmethod
+    async def get_list_sharded(params: dict, start_field: str, start: str, end: str) -> list[dict]:
+        """
+        crm.item.list за большой период. Период делится на части по SHARD_DAYS дней
+        по полю start_field, части получаются параллельно, результат без дублей и по порядку id.
+        """
+        shard = timedelta(days=Settings.SHARD_DAYS)
+        try:
+            period_start = datetime.fromisoformat(start.replace(' ', '+'))
+            period_end = datetime.fromisoformat(end.replace(' ', '+'))
+            is_small = period_end - period_start <= shard
+        except (AttributeError, ValueError, TypeError):
+            is_small = True
+        if is_small:
+            return await BITRIX.get_all("crm.item.list", params)
+        bounds = []
+        while period_start < period_end:
+            bounds.append(period_start)
+            period_start += shard
+        semaphore = asyncio.Semaphore(Settings.SHARD_CONCURRENCY)
+
+        async def get_shard(index: int) -> list[dict]:
+            shard_filter = params['filter'] | {f">={start_field}": bounds[index].isoformat()}
+            if index + 1 < len(bounds):
+                shard_filter[f"<{start_field}"] = bounds[index + 1].isoformat()
+            async with semaphore:
+                return await BITRIX.get_all("crm.item.list", params | {'filter': shard_filter})
+
+        shards = await asyncio.gather(*(get_shard(i) for i in range(len(bounds))))
+        items = {int(i['id']): i for items in shards for i in items}
+        return [items[id] for id in sorted(items)]
 
     # Методы для CRUD-функционала
     @staticmethod
@@ -66,7 +140,13 @@ class BitrixClient:
     async def get_crm_item(entityTypeId: int, id: int) -> dict | None:
         """Получает элемент смарт-процесса."""
         items = {"entityTypeId": entityTypeId, "id": id}
-        return await BITRIX.call("crm.item.get", items)
+        try:
+            result = await LOADER.load("crm.item.get", items)
+        except BitrixCommandError as exc:
+            if exc.error == 'NOT_FOUND':
+                return None
+            raise
+        return (result or {}).get('item', None)
     
     @staticmethod
     async def update_crm_item(entityTypeId: int, id: int, fields: dict) -> dict:
@@ -85,27 +165,35 @@ class BitrixClient:
     async def get_comments_list(appointment_id) -> list[dict]:
         """Получает список комментариев к занятию"""
         items = BitrixClient.get_comment_request_params(appointment_id)
-        result: dict = await BITRIX.call('crm.timeline.comment.list', items, raw=True)
-        return result.get('result', [])
-    
-    @staticmethod
-    async def get_comments_from_appointments(apps):
-        batches = {}
-        builder = BatchBuilder('crm.timeline.comment.list')
-        for i, id in enumerate(apps):
-            builder.params = BitrixClient.get_comment_request_params(id)
-            batches[i] = builder.build()
-        return await BitrixClient.call_batch(batches)
+        result = await LOADER.load('crm.timeline.comment.list', items)
+        return result or []
     
     @staticmethod
-    async def get_comments_from_appointments_by_id(apps):
-        batches = {}
-        builder = BatchBuilder('crm.timeline.comment.list')
-        for _id in apps:
-            builder.params = BitrixClient.get_comment_request_params(_id)
-            batches[_id] = builder.build()
-        return await BitrixClient.call_batch(batches)
-    
+    async def get_history_comments(appointment_ids: Iterable[int]) -> list[dict]:
+        """
+        Комментарии history; сразу для многих занятий, от новых к старым.
+        Занятия фильтруются списком ENTITY_ID, комментарии - по началу текста.
+        """
+        ids = list(dict.fromkeys(appointment_ids))
+        chunks = [ids[i:i + BitrixClient.HISTORY_IDS_CHUNK] for i in range(0, len(ids), BitrixClient.HISTORY_IDS_CHUNK)]
+
+        async def get_chunk(chunk: list[int]) -> list[dict]:
+            params = {
+                'filter': {
+                    'ENTITY_TYPE': f'DYNAMIC_{BXConstants.appointment.entityTypeId}',
+                    'ENTITY_ID': chunk,
+                    '=%COMMENT': 'history;%'
+                },
+                'select': ['ID', 'ENTITY_ID', 'COMMENT'],
+                'order': {'ID': 'DESC'}
+            }
+            return await BITRIX.get_all('crm.timeline.comment.list', params)
+
+        results = await asyncio.gather(*(get_chunk(c) for c in chunks))
+        comments = [c for result in results for c in result]
+        comments.sort(key=lambda c: int(c.get('ID', 0)), reverse=True)
+        return comments
+
     @staticmethod
     async def delete_comment(comment: dict):
         """Удаляет комментарий из таймлайна смарт-процесса"""
@@ -120,6 +208,7 @@ class BitrixClient:
 
     # Методы для фронта
     @staticmethod
+    @SINGLE_FLIGHT
     async def get_all_specialist() -> list[BXSpecialist]:
         params = {
             '@UF_DEPARTMENT': list(BXConstants.departments.keys()),
@@ -131,99 +220,145 @@ class BitrixClient:
         return [BXSpecialist.model_validate(s) for s in result['result']]
     
     @staticmethod
-    async def get_all_clients() -> list[dict]:
+    @SINGLE_FLIGHT
+    async def get_all_clients(since: str | None = None) -> list[dict]:
+        """Получает клиентов. С since - только измененных начиная с этой даты."""
         params = {
-            "select": ["ID", "NAME", "LAST_NAME"],
+            "select": ["ID", "NAME", "LAST_NAME", "DATE_MODIFY"],
             "filter": {"TYPE_ID": "CLIENT"},
         }
+        if since is not None:
+            params["filter"][">=DATE_MODIFY"] = since
         return await BITRIX.get_all("crm.contact.list", params)
     
     @staticmethod
+    @SINGLE_FLIGHT
     async def get_all_appointments(start: str, end: str) -> list[dict]:
         params = {
             "entityTypeId": BXConstants.appointment.entityTypeId,
+            "select": APPOINTMENT_SELECT,
             "filter": {
                 f">={BXConstants.appointment.uf.start}": start,
                 f"<={BXConstants.appointment.uf.end}": end,
             }
         }
-        return await BITRIX.get_all("crm.item.list", params)
+        return await BitrixClient.get_list_sharded(params, BXConstants.appointment.uf.start, start, end)
     
     @staticmethod
+    @SINGLE_FLIGHT
     async def get_all_schedules(start: str, end: str) -> list[dict]:
         params = {
             "entityTypeId": BXConstants.schedule.entityTypeId,
+            "select": SCHEDULE_SELECT,
             "filter": {
                 f">={BXConstants.schedule.uf.date}": start,
                 f"<={BXConstants.schedule.uf.date}": end,
             }
         }
+        return await BitrixClient.get_list_sharded(params, BXConstants.schedule.uf.date, start, end)
+
+
+    # Методы для локального зеркала
+    @staticmethod
+    async def get_updated_items(entityTypeId: int, since: str | None = None) -> list[dict]:
+        """Получает элементы смарт-процесса, измененные начиная с since. Без since - все элементы."""
+        params = {"entityTypeId": entityTypeId, "select": SELECT[entityTypeId]}
+        if since is not None:
+            params["filter"] = {">=updatedTime": since}
+        return await BITRIX.get_all("crm.item.list", params)
+
+    @staticmethod
+    async def get_items_versions(entityTypeId: int, start_field: str, end_field: str, start: str, end: str) -> list[dict]:
+        """Получает только id и updatedTime элементов смарт-процесса за период"""
+        params = {
+            "entityTypeId": entityTypeId,
+            "select": ["id", "updatedTime"],
+            "filter": {f">={start_field}": start, f"<={end_field}": end}
+        }
+        return await BITRIX.get_all("crm.item.list", params)
+
+    @staticmethod
+    async def get_items_by_ids(entityTypeId: int, ids: Iterable) -> list[dict]:
+        """Получает элементы смарт-процесса по списку id"""
+        params = {"entityTypeId": entityTypeId, "select": SELECT[entityTypeId], "filter": {"@id": list(ids)}}
         return await BITRIX.get_all("crm.item.list", params)
 
-    
     # Методы для AppointPlan
     @staticmethod
     async def get_deal_info(id: int) -> dict:
-        response = await BITRIX.call('crm.deal.get', {'id': id}, raw=True)
-        return response.get('result')
+        return await LOADER.load('crm.deal.get', {'id': id})
     
     @staticmethod
     async def get_deal_info_universal(id: int) -> dict:
         items = {'entityTypeId': 2, 'id': id}
-        response = await BITRIX.call('crm.item.get', items=items, raw=True)
-        return response.get('result', {}).get('item', {})
+        response = await LOADER.load('crm.item.get', items)
+        return (response or {}).get('item', {})
 
     @staticmethod
+    @SINGLE_FLIGHT
     async def get_specialists_by_department(names: Iterable) -> list[dict[str, str]]:
         ids = [BXConstants.department_ids.get(n, '0') for n in names]
         params = {'@UF_DEPARTMENT': ids, 'ACTIVE': 'Y'}
         return await BITRIX.get_all('user.get', params)
     
     @staticmethod
+    @SINGLE_FLIGHT
     async def get_specialists_schedules(start, end, spec_ids) -> list[dict]:
         params = {
             "entityTypeId": BXConstants.schedule.entityTypeId,
+            "select": SCHEDULE_SELECT,
             'filter': {
                 f"@{BXConstants.schedule.uf.specialist}": list(spec_ids),
                 f">={BXConstants.schedule.uf.date}": start,
                 f"<={BXConstants.schedule.uf.date}": end,
             }
         }
-        return await BITRIX.get_all("crm.item.list", params)
+        return await BitrixClient.get_list_sharded(params, BXConstants.schedule.uf.date, start, end)
     
     @staticmethod
+    @SINGLE_FLIGHT
     async def get_specialists_appointments(start, end, spec_ids) -> list[dict]:
         params = {
             "entityTypeId": BXConstants.appointment.entityTypeId,
+            "select": APPOINTMENT_SELECT,
             'filter': {
                 f"@{BXConstants.appointment.uf.specialist}": list(spec_ids),
                 f">={BXConstants.appointment.uf.start}": start,
                 f"<={BXConstants.appointment.uf.end}": end,
             }
         }
-        return await BITRIX.get_all("crm.item.list", params)
-    
-    @staticmethod
-    async def fill_comment(*sp_ids):
-        """Запускает бизнес-процесс для указанных элементов смарт-процесса - расписания"""
-        for sp_id in sp_ids:
-            await BitrixClient.run_business_porcess(60, sp_id)
+        return await BitrixClient.get_list_sharded(params, BXConstants.appointment.uf.start, start, end)
     
     @staticmethod
-    async def run_abonnement_control(*sp_ids):
+    async def run_abonnement_control(*sp_ids) -> BatchResult:
         """Запускает бизнес-процесс для контроля списаний с абонемента."""
-        for sp_id in sp_ids:
-            await BitrixClient.run_business_porcess(57, sp_id)
-    
+        return await BitrixClient.run_business_processes(57, *sp_ids)
+
+    @staticmethod
+    async def run_business_processes(bp_id, *sp_ids) -> BatchResult:
+        """
+        Запускает бизнес-процесс для нескольких элементов одним батч запросом, каждый элемент один раз.
+        Ошибки отдельных запусков пишутся в лог и не мешают остальным.
+        """
+        command = BatchBuilder('bizproc.workflow.start', {'TEMPLATE_ID': bp_id}).compile('DOCUMENT_ID')
+        batches = {
+            sp_id: command.build(DOCUMENT_ID=BitrixClient.get_document_id(sp_id))
+            for sp_id in dict.fromkeys(sp_ids)
+        }
+        result = await BitrixClient.execute_batch(batches)
+        if not result.ok:
+            failed = ', '.join(f'{id} ({e.get("error")})' for id, e in result.failed.items())
+            logger.warning(f'Business process {bp_id} was not started for: {failed}')
+        return result
+
     @staticmethod
-    async def run_business_porcess(bp_id, sp_id):
-        docs = [
+    def get_document_id(sp_id) -> list[str]:
+        """DOCUMENT_ID занятия для бизнес-процессов"""
+        return [
             'crm',
             'Bitrix\\Crm\\Integration\\BizProc\\Document\\Dynamic',
             f'DYNAMIC_{BXConstants.appointment.entityTypeId}_{sp_id}'
         ]
-        params = {'TEMPLATE_ID': bp_id, 'DOCUMENT_ID': docs}
-        return await BITRIX.call('bizproc.workflow.start', params)
 
     @staticmethod
     async def add_comment_to_deal(deal_id: int, comment: str):
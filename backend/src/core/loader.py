@@ -0,0 +1,79 @@
+import asyncio
+
+from fast_bitrix24 import BitrixAsync
+
+from src.utils import BatchBuilder
+from .batch import split_commands
+
+
+class BitrixCommandError(Exception):
+    """Ошибка отдельной команды батча"""
+
+    def __init__(self, error: dict | str):
+        if not isinstance(error, dict):
+            error = {'error': str(error)}
+        self.error = error.get('error', '')
+        self.description = error.get('error_description', '')
+        super().__init__(f'{self.error}: {self.description}')
+
+
+class BatchLoader:
+    """
+    Собирает одиночные запросы на чтение, сделанные за один проход цикла событий,
+    и отправляет их одним батч запросом. Каждый вызвавший получает результат своей команды.
+    """
+
+    def __init__(self, bitrix: BitrixAsync, batch_size: int, max_bytes: int | None = None):
+        self.bitrix = bitrix
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.batches = 0                # Сколько батчей отправлено
+        self.commands = 0               # Сколько команд в них было
+        self._pending: dict[str, tuple[str, asyncio.Future]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def load(self, method: str, params: dict) -> asyncio.Future:
+        """Ставит команду в очередь. Возвращает future с результатом команды."""
+        loop = asyncio.get_running_loop()
+        if not self._pending:
+            loop.call_soon(self._dispatch)
+        future = loop.create_future()
+        key = f'cmd{len(self._pending)}'
+        self._pending[key] = (BatchBuilder(method, params).build(), future)
+        return future
+
+    def _dispatch(self):
+        pending, self._pending = self._pending, {}
+        commands = {key: command for key, (command, _) in pending.items()}
+        for part in split_commands(commands, self.batch_size, self.max_bytes):
+            chunk = {key: pending[key] for key in part}
+            task = asyncio.create_task(self._send(chunk))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, chunk: dict[str, tuple[str, asyncio.Future]]):
+        self.batches += 1
+        self.commands += len(chunk)
+        cmd = {key: command for key, (command, _) in chunk.items()}
+        try:
+            response = await self.bitrix.call('batch', {'halt': 0, 'cmd': cmd}, raw=True)
+        except Exception as exc:
+            for _, future in chunk.values():
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        batch = response.get('result', {})
+        results = batch.get('result') or {}
+        errors = batch.get('result_error') or {}
+        for key, (_, future) in chunk.items():
+            if future.done():
+                continue
+            if isinstance(errors, dict) and key in errors:
+                future.set_exception(BitrixCommandError(errors[key]))
+            elif isinstance(results, dict):
+                future.set_result(results.get(key, None))
+            else:
+                future.set_result(None)
+
+    def stats(self) -> dict:
+        return {'batches': self.batches, 'commands': self.commands, 'pending': len(self._pending)}
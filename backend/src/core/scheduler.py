@@ -0,0 +1,121 @@
+import asyncio
+from collections import deque
+from contextvars import ContextVar
+from time import monotonic
+
+from fast_bitrix24 import BitrixAsync
+
+
+class Lane:
+    """Очереди запросов к битре в порядке приоритета"""
+    INTERACTIVE = 'interactive'     # Чтение для фронта
+    WRITE = 'write'                 # Изменения с фронта
+    BACKGROUND = 'background'       # Планирование, бизнес-процессы, синхронизация
+
+    order = (INTERACTIVE, WRITE, BACKGROUND)
+
+
+# Очередь, явно заданная для текущей задачи. Наследуется дочерними задачами.
+CURRENT_LANE: ContextVar[str | None] = ContextVar('bitrix_lane', default=None)
+
+_READ_ENDINGS = ('.get', '.list', '.fields')
+
+
+def get_lane(method: str, params: dict | None) -> str:
+    """Определяет очередь запроса: явно заданная или по методу"""
+    lane = CURRENT_LANE.get()
+    if lane is not None:
+        return lane
+    if method == 'batch':
+        commands = (params or {}).get('cmd', {}).values()
+        methods = [c.split('?', 1)[0] for c in commands]
+    else:
+        methods = [method]
+    if any(m.startswith('bizproc.') for m in methods):
+        return Lane.BACKGROUND
+    if all(m.endswith(_READ_ENDINGS) for m in methods):
+        return Lane.INTERACTIVE
+    return Lane.WRITE
+
+
+class RequestScheduler:
+    """
+    Общий для процесса токен-бакет перед битрой.
+    Размер и скорость пополнения совпадают с лимитами портала.
+    Свободный токен получает первый запрос из самой приоритетной непустой очереди.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = monotonic()
+        self.queues: dict[str, deque[tuple[asyncio.Future, float]]] = {l: deque() for l in Lane.order}
+        self.metrics = {l: {'requests': 0, 'wait_total': 0.0, 'wait_max': 0.0} for l in Lane.order}
+        self._task: asyncio.Task | None = None
+
+    def attach(self, bitrix: BitrixAsync):
+        """Пропускает все http запросы клиента через планировщик"""
+        single_request = bitrix.srh.single_request
+
+        async def scheduled_request(method: str, params=None):
+            await self.acquire(get_lane(method, params))
+            return await single_request(method, params)
+
+        bitrix.srh.single_request = scheduled_request
+
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _record(self, lane: str, wait: float):
+        metric = self.metrics[lane]
+        metric['requests'] += 1
+        metric['wait_total'] += wait
+        metric['wait_max'] = max(metric['wait_max'], wait)
+
+    async def acquire(self, lane: str):
+        """Ждет токен для запроса из очереди lane"""
+        self._refill()
+        if self.tokens >= 1 and not any(self.queues.values()):
+            self.tokens -= 1
+            self._record(lane, 0.0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.queues[lane].append((future, monotonic()))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self):
+        """Раздает токены ожидающим по мере пополнения бакета"""
+        while any(self.queues.values()):
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            for lane in Lane.order:
+                queue = self.queues[lane]
+                while queue and queue[0][0].done():     # Отмененные ожидания
+                    queue.popleft()
+                if queue:
+                    future, queued_at = queue.popleft()
+                    self.tokens -= 1
+                    self._record(lane, monotonic() - queued_at)
+                    future.set_result(None)
+                    break
+
+    def stats(self) -> dict:
+        """Глубина очереди и время ожидания по каждой очереди"""
+        result = {'tokens': round(self.tokens, 2)}
+        for lane in Lane.order:
+            metric = self.metrics[lane]
+            requests = metric['requests']
+            result[lane] = {
+                'queue_depth': len(self.queues[lane]),
+                'requests': requests,
+                'wait_avg': round(metric['wait_total'] / requests, 4) if requests else 0.0,
+                'wait_max': round(metric['wait_max'], 4),
+            }
+        return result
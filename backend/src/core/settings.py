@@ -14,12 +14,50 @@ class _Settings(BaseSettings):
     DEFAULT_USER: int
     TIMEZONE: ZoneInfo = ZoneInfo('Europe/Moscow')
 
+    # Лимиты портала: пул запросов и скорость его восстановления
+    BITRIX_REQUEST_POOL: int = 50
+    BITRIX_REQUESTS_PER_SECOND: float = 2.0
+    BATCH_CONCURRENCY: int = 5          # Сколько порций батча отправлять одновременно
+    BATCH_MAX_BYTES: int = 512 * 1024   # Предельный размер команд в одной порции батча, байт
+    BATCH_RETRIES: int = 3              # Сколько раз повторять команды батча с временными ошибками
+    BATCH_RETRY_DELAY: float = 0.5      # Пауза перед первым повтором, дальше удваивается, сек.
+    SHARD_DAYS: int = 31                # На части какой длины делить большие периоды при чтении
+    SHARD_CONCURRENCY: int = 4          # Сколько частей периода читать одновременно
+
+    # Локальные базы sqlite. DATA_DIR нужно монтировать как volume, иначе данные теряются при пересборке.
+    DATA_DIR: Path = ROOT_PATH / 'data'
+    MIRROR_PATH: str = ''               # Зеркало занятий и графиков, по умолчанию DATA_DIR/mirror.sqlite3
+    MIRROR_SYNC_INTERVAL: int = 60      # Период синхронизации с битрой, сек.
+    CHANGES_RETENTION: int = 24 * 60 * 60   # Сколько хранить журнал изменений для фронта, сек.
+    STREAM_QUEUE_SIZE: int = 1000           # Сколько событий копить для медленного подписчика /front/stream
+    STREAM_HEARTBEAT: int = 15              # Период пустых сообщений в /front/stream, сек.
+    HISTORY_PATH: str = ''                  # История изменений занятий, по умолчанию DATA_DIR/history.sqlite3
+    HISTORY_COMMENTS_TTL: int = 10 * 60     # Сколько хранить разобранные комменты history; сек.
+    HISTORY_COMMENTS_MAX_SIZE: int = 20000  # Сколько занятий с разобранными комментами держать в памяти
+
+    SPECIALISTS_TTL: int = 10 * 60      # Время жизни справочника специалистов, сек.
+    CLIENTS_TTL: int = 60               # Как часто догружать измененных клиентов, сек.
+    CLIENTS_FULL_TTL: int = 60 * 60     # Как часто загружать клиентов целиком, чтобы убрать удаленных, сек.
+    CLIENTS_MISS_INTERVAL: int = 10     # Не чаще раза в столько сек. догружать клиентов из-за неизвестного id
+    FREE_TIME_TTL: int = 5 * 60         # Время жизни кэша свободного времени специалистов, сек.
+    ABONNEMENT_CONTROL_DELAY: float = 5.0   # Через сколько после последнего изменения занятия запускать контроль абонемента, сек.
+
+    # Исходящие события битры
+    BITRIX_EVENTS_TOKEN: str | None = None  # application_token обработчика, если не задан - события не принимаются
+    RECONCILE_INTERVAL: int = 15 * 60       # Период сверки зеркала с битрой, сек.
+    RECONCILE_DAYS: int = 60                # Сверяется период [сегодня - N дней, сегодня + N дней]
+    RECONCILE_MAX_DAYS: int = 31            # Самый длинный период для ручной сверки через /events/reconcile
+
     model_config = ConfigDict(
         env_file = f"{ROOT_PATH}/.env",
         env_file_encoding = "utf-8",
         extra = "ignore"
     )
 
+    def model_post_init(self, context):
+        self.MIRROR_PATH = self.MIRROR_PATH or str(self.DATA_DIR / 'mirror.sqlite3')
+        self.HISTORY_PATH = self.HISTORY_PATH or str(self.DATA_DIR / 'history.sqlite3')
+
     @field_validator('TIMEZONE', mode='before')
     def parse_timezone(cls, v):
         if isinstance(v, str):
@@ -0,0 +1,2 @@
+from .routing import router as events_router
+from .reconciler import Reconciler
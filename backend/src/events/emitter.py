@@ -0,0 +1,37 @@
+from urllib.parse import urlencode
+
+from src.core import Settings
+
+
+class LocalEventEmitter:
+    """
+    Локальная замена исходящих вебхуков битры.
+    Шлет в приложение события в том же виде, что и портал. Используется в тестах.
+    """
+
+    __slots__ = ('client', 'url')
+
+    events = {
+        'add': 'ONCRMDYNAMICITEMADD',
+        'update': 'ONCRMDYNAMICITEMUPDATE',
+        'delete': 'ONCRMDYNAMICITEMDELETE',
+    }
+
+    def __init__(self, client, url: str = '/events/'):
+        self.client = client        # TestClient или любой клиент с методом post
+        self.url = url
+
+    @classmethod
+    def payload(cls, action: str, entityTypeId: int, id: int) -> str:
+        """Тело запроса события в формате битры"""
+        data = {
+            'event': cls.events[action],
+            'data[FIELDS][ID]': id,
+            'data[FIELDS][ENTITY_TYPE_ID]': entityTypeId,
+            'auth[application_token]': Settings.BITRIX_EVENTS_TOKEN or '',
+        }
+        return urlencode(data)
+
+    def emit(self, action: str, entityTypeId: int, id: int):
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        return self.client.post(self.url, content=self.payload(action, entityTypeId, id), headers=headers)
@@ -0,0 +1,65 @@
+from urllib.parse import parse_qsl
+
+from src.core import BitrixClient, Settings
+from src.logger import logger
+from src.services import MIRROR
+
+
+class EventException(Exception):
+    """Событие не прошло проверку"""
+    pass
+
+
+class EventAuthException(EventException):
+    """Неверный application_token или токен не настроен - события не принимаются"""
+    pass
+
+
+def check_token(token: str | None):
+    """Проверяет application_token. Без настроенного BITRIX_EVENTS_TOKEN не принимается ничего."""
+    if Settings.BITRIX_EVENTS_TOKEN is None:
+        raise EventAuthException('BITRIX_EVENTS_TOKEN is not set, events are not accepted.')
+    if token != Settings.BITRIX_EVENTS_TOKEN:
+        raise EventAuthException('Wrong application token.')
+
+
+class EventHandler:
+    """Применяет исходящее событие битры (смарт-процессы) к локальному зеркалу"""
+
+    __slots__ = ('event', 'id', 'entityTypeId', 'token')
+
+    add_events = ('ONCRMDYNAMICITEMADD', 'ONCRMDYNAMICITEMUPDATE')
+    delete_events = ('ONCRMDYNAMICITEMDELETE', )
+
+    def __init__(self, body: str):
+        # event=ONCRMDYNAMICITEMUPDATE&data[FIELDS][ID]=1607&data[FIELDS][ENTITY_TYPE_ID]=1036&auth[application_token]=...
+        data = dict(parse_qsl(body))
+        self.event = data.get('event', '').upper()
+        self.id = data.get('data[FIELDS][ID]', None)
+        self.entityTypeId = data.get('data[FIELDS][ENTITY_TYPE_ID]', None)
+        self.token = data.get('auth[application_token]', None)
+
+    def validate(self):
+        check_token(self.token)
+        if self.event not in self.add_events + self.delete_events:
+            raise EventException(f'Unsupported event {self.event}.')
+        if not (str(self.id).isdigit() and str(self.entityTypeId).isdigit()):
+            raise EventException(f'Event {self.event} has no item id or entity type id.')
+
+    def is_mirrored(self) -> bool:
+        return int(self.entityTypeId) in MIRROR.tables
+
+    async def run(self) -> bool:
+        """Применяет событие. Возвращает False, если событие не относится к зеркалу."""
+        self.validate()
+        if not self.is_mirrored():
+            return False
+        entityTypeId, id = int(self.entityTypeId), int(self.id)
+        if self.event in self.delete_events:
+            await MIRROR.delete(entityTypeId, id)
+        else:
+            item = await BitrixClient.get_crm_item(entityTypeId, id)
+            if item is not None:
+                await MIRROR.save(entityTypeId, item)
+        logger.debug(f'Event {self.event} for item {entityTypeId}:{id} was applied.')
+        return True
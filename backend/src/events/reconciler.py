@@ -0,0 +1,68 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from src.core import BitrixClient, Settings, Lane, CURRENT_LANE
+from src.logger import logger
+from src.services import MIRROR
+
+
+class Reconciler:
+    """Сверяет зеркало с битрой за период и исправляет пропущенные события"""
+
+    __slots__ = ('start', 'end', 'saved', 'deleted')
+
+    _task: asyncio.Task | None = None
+
+    def __init__(self, start: str, end: str):
+        self.start = start
+        self.end = end
+        self.saved = 0          # Сколько элементов добавлено или обновлено
+        self.deleted = 0        # Сколько элементов удалено
+
+    @classmethod
+    def for_current_window(cls):
+        """Период вокруг сегодняшнего дня, в котором чаще всего меняют занятия"""
+        now = datetime.now(Settings.TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+        delta = timedelta(days=Settings.RECONCILE_DAYS)
+        return cls((now - delta).isoformat(), (now + delta).isoformat())
+
+    async def run(self) -> dict[str, int]:
+        await asyncio.gather(*(self.reconcile_table(t) for t in MIRROR.tables.values()))
+        if self.saved or self.deleted:
+            logger.info(f'Mirror reconciled: {self.saved} items saved, {self.deleted} items deleted.')
+        return {'saved': self.saved, 'deleted': self.deleted}
+
+    async def reconcile_table(self, table):
+        # Сначала снимок зеркала, потом список битры: элемент, записанный в зеркало между чтениями,
+        # уже есть в битре и не будет принят за удаленный
+        local = await MIRROR.get_versions(table.entityTypeId, self.start, self.end)
+        remote_list = await BitrixClient.get_items_versions(
+            table.entityTypeId, table.start, table.end, self.start, self.end
+        )
+        remote = {int(i['id']): i.get('updatedTime') for i in remote_list}
+        to_delete = local.keys() - remote.keys()
+        to_save = [id for id, updated in remote.items() if local.get(id, False) != updated]
+        if to_delete:
+            await MIRROR.delete(table.entityTypeId, *to_delete)
+            self.deleted += len(to_delete)
+        if to_save:
+            items = await BitrixClient.get_items_by_ids(table.entityTypeId, to_save)
+            await MIRROR.save(table.entityTypeId, *items)
+            self.saved += len(items)
+
+    @classmethod
+    def start_periodic(cls):
+        """Запускает периодическую сверку в фоне"""
+        if cls._task is None or cls._task.done():
+            cls._task = asyncio.create_task(cls.run_periodic())
+
+    @staticmethod
+    async def run_periodic():
+        """Периодическая сверка текущего периода"""
+        CURRENT_LANE.set(Lane.BACKGROUND)
+        while True:
+            await asyncio.sleep(Settings.RECONCILE_INTERVAL)
+            try:
+                await Reconciler.for_current_window().run()
+            except Exception as exc:
+                logger.error(f'Mirror reconciliation failed: {exc}')
@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from fastapi import APIRouter, Depends, Header, Request
+from fastapi.exceptions import HTTPException
+
+from src.schemas.api import QueryDateRange, parse_datetime
+from src.core import Settings
+from src.logger import logger
+from .handler import EventHandler, EventException, EventAuthException, check_token
+from .reconciler import Reconciler
+
+
+router = APIRouter(prefix="/events", tags=['Events'])
+
+if Settings.BITRIX_EVENTS_TOKEN is None:
+    logger.warning('BITRIX_EVENTS_TOKEN is not set: /events/ rejects all events, the mirror relies on reconciliation.')
+
+
+@router.post("/", status_code=200)
+async def handle_event(request: Request) -> dict:
+    """Принимает исходящие события битры по смарт-процессам занятий и графиков."""
+    body = await request.body()
+    handler = EventHandler(body.decode())
+    try:
+        applied = await handler.run()
+    except EventAuthException as exc:
+        raise HTTPException(status_code=403, detail=str(exc))
+    except EventException as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {'applied': applied}
+
+
+@router.post("/reconcile", status_code=200)
+async def reconcile(
+    query: QueryDateRange = Depends(),
+    x_application_token: str | None = Header(None)
+) -> dict[str, int]:
+    """
+    Сверяет зеркало с битрой за период. Требует тот же токен, что и события, в заголовке X-Application-Token.
+    Период не длиннее RECONCILE_MAX_DAYS: каждая сверка - это выгрузка всех элементов периода из битры.
+    """
+    try:
+        check_token(x_application_token)
+    except EventAuthException as exc:
+        raise HTTPException(status_code=403, detail=str(exc))
+    period = parse_datetime(query.end) - parse_datetime(query.start)
+    if not timedelta(0) < period <= timedelta(days=Settings.RECONCILE_MAX_DAYS):
+        raise HTTPException(
+            status_code=422,
+            detail=f'Reconcile period must be positive and not longer than {Settings.RECONCILE_MAX_DAYS} days.'
+        )
+    return await Reconciler(query.start, query.end).run()
@@ -2,12 +2,13 @@ import asyncio
 from datetime import datetime, timedelta
 
 from src.utils import BatchBuilder
-from src.core import Settings, BXConstants, BitrixClient
+from src.core import Settings, BXConstants, BitrixClient, BatchError, Lane, CURRENT_LANE
 from src.schemas.repetative import RequestSchema
 from src.schemas.appointplan import BXSchedule
 from src.schemas.api import BXClient
 
 from src.logger import logger
+from src.services import SPECIALISTS, CLIENTS
 
 
 class Handler:
@@ -22,6 +23,7 @@ class Handler:
         self.messages = []
     
     async def run(self):
+        CURRENT_LANE.set(Lane.BACKGROUND)
         context = Context(self)
         try:
             await context.fill()
@@ -29,9 +31,10 @@ class Handler:
         except Exception as e:
             self.repetatives.clear()
             self.messages.append(str(e))
-        t = asyncio.create_task(self.send_message())
+        result = await self.send_appointments()
+        asyncio.create_task(self.send_message())
         asyncio.create_task(self.send_comment())
-        return await self.send_appointments()
+        return result
 
     def create_repetatives(self):
         """Создает повторяющиеся занятия"""
@@ -83,27 +86,28 @@ class Handler:
     
     async def send_appointments(self):
         """Посылает батч-запрос на расстановку занятий в битру."""
-        batches = {}
-        for index, appointment in enumerate(self.repetatives):
-            batch = BatchBuilder(
-                'crm.item.add',
-                {'entityTypeId': BXConstants.appointment.entityTypeId, 'fields': appointment}
-            )
-            batches[index] = batch.build()
-        if batches:
+        command = BatchBuilder(
+            'crm.item.add',
+            {'entityTypeId': BXConstants.appointment.entityTypeId}
+        ).compile('fields')
+        batches = {index: command.build(fields=a) for index, a in enumerate(self.repetatives)}
+        if not batches:
+            return None
+        try:
             return await BitrixClient.call_batch(batches)
+        except BatchError as exc:
+            # В сообщении и комменте остаются только созданные занятия
+            self.messages.append(f'{len(exc.errors)} занятий не удалось создать в битре.')
+            logger.error(f'Repetative: appointments {list(exc.errors)} were not created. {exc.errors}')
+            self.repetatives = [a for i, a in enumerate(self.repetatives) if i not in exc.errors]
+            return exc.successes
     
     async def send_comment(self):
         """Создает коммент к сделке"""
         if not self.repetatives:
             return
-        specialists = await BitrixClient.get_all_specialist()
-        specialist = int(self.data.specialist_id)
-        for spec in specialists:
-            if spec.id == specialist:
-                specialist = spec
-                break
-        spec_fio = specialist.name    # type:ignore
+        specialist = await SPECIALISTS.get(self.data.specialist_id)
+        spec_fio = specialist.name if specialist is not None else str(self.data.specialist_id)
         template = f"[*] {spec_fio} - {self.patient.full_name}, {self.data.code}, " + "{0}, {1} минут."
 
         def iterator():
@@ -149,18 +153,12 @@ class Context:
 
     async def fill_patient(self):
         """Получает из сделки информацию по пациенту"""
-        clients = await BitrixClient.get_all_clients()
         deal = await BitrixClient.get_deal_info_universal(self.handler.data.deal_id)
-        contacts_set = set()
         contacts = deal.get('contactIds', [])
         if isinstance(contacts, list):
-            contacts_set.update(contacts)
-        if contacts_set:
-            for client in clients:
-                client_id = client.get('ID', None)
-                if isinstance(client_id, str) and client_id.isdigit():
-                    client_id = int(client_id)
-                    if client_id in contacts_set:
-                        self.handler.patient = BXClient.model_validate(client)
-                        return
+            for contact_id in contacts:
+                client = await CLIENTS.get(contact_id)
+                if client is not None:
+                    self.handler.patient = client
+                    return
         raise Exception('В сделке не установлен клиент или у клиента неподходящий тип')
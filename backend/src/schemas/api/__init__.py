@@ -1,4 +1,6 @@
 from .appointment import Appointment, BXAppointment, AbonnementCancelDate
 from .schedule import Schedule, BXSchedule
-from .main import BXSpecialist, BXClient, QueryDateRange
+from .main import BXSpecialist, BXClient, QueryDateRange, parse_datetime, ClientsPage, ClientsQuery, ChangesQuery, DeletedIds, Changes
 from .production_calendar import RangeQuery
+from .view import ViewDay, ViewSpecialist, View
+from .free_slots import FreeSlotsQuery, FreeSlot
@@ -87,34 +87,34 @@ class BXAppointment(BaseModel):
         self.old_code = self.code
         self.old_status = self.status
 
-    def parse_last_comment(self, comments: list[dict]) -> None:
-        """Парсит комментарии с целью поиска коммента старых значений."""
-        target = None
-        for comment_item in comments:
-            comment: str = comment_item.get('COMMENT', '')
-            if comment.startswith('history;'):
-                target = comment
-                break
-        if target is None:
-            return
+    def set_previous(self, previous: dict) -> None:
+        """Заполняет значения для истории из записи локальной истории."""
+        self.old_specialist = previous.get('specialist', self.specialist)
+        self.old_patient = previous.get('patient', self.patient)
+        self.old_start = previous.get('start', self.start)
+        self.old_end = previous.get('end', self.end)
+        self.old_code = previous.get('code', self.code)
+        if previous.get('status'):
+            self.old_status = previous['status']
+
+    @classmethod
+    def parse_history_comment(cls, comment: str) -> dict | None:
+        """Разбирает коммент history; в значения для истории. Если коммент не разобрать - None."""
+        if not comment.startswith('history;'):
+            return None
         try:
-            values = target.split(';')
+            values = comment.split(';')
             # ['history', 'user_15', '30', '28.07.2025 09:00:00', '28.07.2025 10:00:00', 'L', 'Единичное', '197', '']
-            old_specialst = int(values[1][5:])
-            old_patient = int(values[2])
-            old_start = self._parse_bx_date(values[3])
-            old_end = self._parse_bx_date(values[4])
-            old_code = values[5]
-            old_status = values[6]
-            self.old_specialist = old_specialst
-            self.old_patient = old_patient
-            self.old_start = old_start
-            self.old_end = old_end
-            self.old_code = old_code
-            if old_status:
-                self.old_status = old_status
-        except:
-            pass
+            return {
+                'specialist': int(values[1][5:]),
+                'patient': int(values[2]),
+                'start': cls._parse_bx_date(values[3]),
+                'end': cls._parse_bx_date(values[4]),
+                'code': values[5],
+                'status': values[6] or None,
+            }
+        except (IndexError, ValueError):
+            return None
 
     @staticmethod
     def _parse_bx_date(date: str) -> datetime:
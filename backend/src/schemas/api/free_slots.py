@@ -0,0 +1,19 @@
+from datetime import datetime, time
+
+from pydantic import BaseModel, Field
+
+from .main import QueryDateRange
+
+
+class FreeSlotsQuery(QueryDateRange):
+    duration: int = Field(ge=5, le=8 * 60)      # Длительность занятия, минут
+    time_from: time | None = None               # Не раньше, чем
+    time_to: time | None = None                 # Не позже, чем
+    limit: int = Field(default=20, ge=1, le=200)
+
+
+class FreeSlot(BaseModel):
+    """Свободное время специалиста под занятие"""
+    specialist: int
+    start: datetime
+    end: datetime
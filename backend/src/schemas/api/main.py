@@ -1,6 +1,12 @@
-from pydantic import BaseModel, ConfigDict, Field, field_validator, computed_field
+import re
+from datetime import datetime
+from typing import Annotated
 
-from src.core import BXConstants
+from pydantic import AfterValidator, BaseModel, ConfigDict, Field, field_validator, computed_field
+
+from src.core import BXConstants, Settings
+from .appointment import BXAppointment
+from .schedule import BXSchedule
 
 
 class BXSpecialist(BaseModel):
@@ -51,6 +57,55 @@ class BXClient(BaseModel):
         return name
 
 
+class ClientsPage(BaseModel):
+    """Страница результатов поиска клиентов"""
+    total: int
+    items: list[BXClient]
+
+
+class ClientsQuery(BaseModel):
+    q: str = ''
+    offset: int = Field(default=0, ge=0)
+    limit: int = Field(default=50, ge=1, le=500)
+
+
+def parse_datetime(value: str) -> datetime:
+    """
+    Разбирает дату в формате iso. Незакодированный '+' смещения в query приходит пробелом:
+    2025-05-01T10:00:00 03:00 -> 2025-05-01T10:00:00+03:00. Даты без таймзоны считаются локальными.
+    """
+    date = datetime.fromisoformat(re.sub(r' (\d{2}:?\d{2})$', r'+\1', value.strip()))
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=Settings.TIMEZONE)
+    return date
+
+
+def _normalize_datetime(value: str) -> str:
+    return parse_datetime(value).isoformat()
+
+
+# Дата из query: проверяется (иначе 422) и приводится к iso с таймзоной
+IsoDateTime = Annotated[str, AfterValidator(_normalize_datetime)]
+
+
 class QueryDateRange(BaseModel):
-    start: str
-    end: str
+    start: IsoDateTime
+    end: IsoDateTime
+
+
+class ChangesQuery(QueryDateRange):
+    since: str
+
+
+class DeletedIds(BaseModel):
+    """id удаленных или ушедших из периода элементов"""
+    appointments: list[int] = []
+    schedules: list[int] = []
+
+
+class Changes(BaseModel):
+    """Изменения периода после курсора. cursor передается в следующий запрос как since."""
+    cursor: str
+    appointments: list[BXAppointment]
+    schedules: list[BXSchedule]
+    deleted: DeletedIds
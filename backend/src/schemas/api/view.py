@@ -0,0 +1,30 @@
+from datetime import date as Date
+
+from pydantic import BaseModel
+
+from .appointment import BXAppointment
+from .schedule import BXSchedule
+from .main import BXSpecialist, BXClient
+
+
+class ViewDay(BaseModel):
+    """Графики и занятия специалиста за день"""
+    date: Date
+    holiday: bool = False
+    schedules: list[BXSchedule] = []
+    appointments: list[BXAppointment] = []
+
+
+class ViewSpecialist(BaseModel):
+    """Строка таблицы: специалист и его дни. specialist пустой, если его уже нет в справочнике."""
+    id: int
+    specialist: BXSpecialist | None = None
+    days: list[ViewDay] = []
+
+
+class View(BaseModel):
+    """Все данные основной таблицы за период одним ответом"""
+    cursor: str
+    holidays: list[Date]
+    clients: list[BXClient]
+    specialists: list[ViewSpecialist]
@@ -1,2 +1,7 @@
 from .on_startup import on_startup
-from .funcs import get_comment
\ No newline at end of file
+from .funcs import get_comment
+from .mirror import MIRROR, BROKER
+from .specialists import SPECIALISTS
+from .clients import CLIENTS
+from .abonnement import ABONNEMENT_CONTROL
+from .history import HISTORY, HISTORY_COMMENTS, fill_previous
@@ -0,0 +1,77 @@
+import asyncio
+from time import monotonic
+
+from src.core import Settings, BitrixClient, Lane, CURRENT_LANE
+from src.logger import logger
+
+
+class AbonnementControlQueue:
+    """
+    Очередь запуска бизнес-процесса контроля абонемента.
+    Повторная постановка занятия откладывает его запуск на delay секунд,
+    все занятия, у которых вышло время, запускаются одним батч запросом.
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.launched = 0                       # Сколько занятий отправлено в битру
+        self.coalesced = 0                      # Сколько повторных постановок схлопнуто
+        self._pending: dict[int, float] = {}    # {id занятия: когда запускать}
+        self._worker: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()  # Запущенные батчи
+
+    def schedule(self, *ids: int):
+        """Ставит занятия в очередь. Если занятие уже ждет запуска - откладывает его."""
+        deadline = monotonic() + self.delay
+        for id in ids:
+            if self._pending.pop(int(id), None) is not None:
+                self.coalesced += 1
+            self._pending[int(id)] = deadline
+        if self._pending and (self._worker is None or self._worker.done()):
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        CURRENT_LANE.set(Lane.BACKGROUND)
+        while self._pending:
+            # Очередь упорядочена по времени постановки, первым истекает первый элемент
+            wait = next(iter(self._pending.values())) - monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            now = monotonic()
+            ready = [id for id, deadline in self._pending.items() if deadline <= now]
+            for id in ready:
+                del self._pending[id]
+            self._launch(ready)
+
+    def _launch(self, ids: list[int]):
+        self.launched += len(ids)
+        task = asyncio.create_task(BitrixClient.run_abonnement_control(*ids))
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+
+    def _done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f'Abonnement control failed: {task.exception()}')
+
+    async def flush(self):
+        """Запускает все ожидающие занятия сразу и ждет завершения. Для остановки приложения."""
+        if self._worker is not None:
+            self._worker.cancel()
+        if self._pending:
+            ids, self._pending = list(self._pending), {}
+            self._launch(ids)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth': len(self._pending),
+            'in_flight': len(self._tasks),
+            'launched': self.launched,
+            'coalesced': self.coalesced,
+        }
+
+
+ABONNEMENT_CONTROL = AbonnementControlQueue(Settings.ABONNEMENT_CONTROL_DELAY)
@@ -0,0 +1,71 @@
+import asyncio
+from typing import Callable, Iterable
+
+
+class Subscription:
+    """Подписка клиента на изменения в периоде и, если заданы, у конкретных специалистов"""
+
+    __slots__ = ('start', 'end', 'specialists', 'queue', 'overflow')
+
+    def __init__(self, start: float, end: float, specialists: Iterable[int] | None, size: int):
+        self.start = start
+        self.end = end
+        self.specialists = set(specialists) if specialists is not None else None
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(size)
+        self.overflow = False               # Клиент не успевал читать, события потеряны
+
+    def matches(self, event: dict) -> bool:
+        """Событие касается подписки, если элемент был или стал виден в ее периоде и у ее специалистов"""
+        for specialist, start, end in event['positions']:
+            if start is None or end is None or start < self.start or end > self.end:
+                continue
+            if self.specialists is None or (specialist is not None and int(specialist) in self.specialists):
+                return True
+        return False
+
+
+class ChangeBroker:
+    """Раздает события изменений зеркала подписчикам потока /front/stream"""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.published = 0
+        self._subscriptions: set[Subscription] = set()
+        self._listeners: list[Callable[[list[dict]], None]] = []
+
+    def subscribe(self, start: float, end: float, specialists: Iterable[int] | None = None) -> Subscription:
+        subscription = Subscription(start, end, specialists, self.queue_size)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+
+    def listen(self, listener: Callable[[list[dict]], None]):
+        """Внутренний обработчик, получает все события целиком (например, для сброса кэшей)"""
+        self._listeners.append(listener)
+
+    def publish(self, events: list[dict]):
+        """
+        Кладет события в очереди подходящих подписок. Событие для клиента компактное:
+        что изменилось и курсор, с которым можно дочитать изменения через /front/changes.
+        """
+        for listener in self._listeners:
+            listener(events)
+        for event in events:
+            self.published += 1
+            message = {k: event[k] for k in ('cursor', 'entity', 'id', 'action')}
+            for subscription in self._subscriptions:
+                if subscription.overflow or not subscription.matches(event):
+                    continue
+                try:
+                    subscription.queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    subscription.overflow = True
+
+    def stats(self) -> dict:
+        return {
+            'subscribers': len(self._subscriptions),
+            'published': self.published,
+            'queued': sum(s.queue.qsize() for s in self._subscriptions),
+        }
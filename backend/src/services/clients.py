@@ -0,0 +1,101 @@
+from bisect import bisect_left
+from time import monotonic
+
+from src.core import Settings, BitrixClient
+from src.schemas.api import BXClient
+from src.logger import logger
+from .directory import Directory
+
+
+def normalize(value: str | None) -> str:
+    """Приводит имя к виду для поиска: нижний регистр, ё -> е"""
+    return (value or '').lower().replace('ё', 'е').strip()
+
+
+class ContactDirectory(Directory):
+    """
+    Справочник клиентов с индексом по id и по префиксам слов имени.
+    Между полными загрузками догружает только контакты, измененные после DATE_MODIFY.
+    """
+
+    def __init__(
+        self,
+        ttl: int,
+        full_ttl: int = Settings.CLIENTS_FULL_TTL,
+        miss_interval: int = Settings.CLIENTS_MISS_INTERVAL
+    ):
+        super().__init__(ttl)
+        self.full_ttl = full_ttl
+        self.miss_interval = miss_interval
+        self.by_id: dict[int, BXClient] = {}
+        self.sorted: list[BXClient] = []                    # Отсортированы по полному имени
+        self.watermark: str | None = None                   # Последний DATE_MODIFY
+        self.full_loaded_at: float | None = None            # Когда последний раз загружали всех клиентов
+        self._tokens: dict[int, tuple[str, ...]] = {}       # Слова имени клиента
+        self._index: list[tuple[str, int]] = []             # Отсортированные пары (слово, id)
+
+    async def load(self):
+        """
+        Догружает измененных клиентов. Раз в full_ttl загружает всех заново: удаленные контакты
+        и контакты, которые перестали быть клиентами, в догрузку по DATE_MODIFY не попадают.
+        """
+        full = self.full_loaded_at is None or monotonic() - self.full_loaded_at > self.full_ttl
+        raw_clients = await BitrixClient.get_all_clients(None if full else self.watermark)
+        if full:
+            self.full_loaded_at = monotonic()
+        elif not raw_clients:
+            return False
+        by_id = {} if full else dict(self.by_id)
+        watermark = None if full else self.watermark
+        for raw_client in raw_clients:
+            client = BXClient.model_validate(raw_client)
+            by_id[client.id] = client
+            modified = raw_client.get('DATE_MODIFY', None)
+            if modified and (watermark is None or modified > watermark):
+                watermark = modified
+        self.watermark = watermark
+        if by_id == self.by_id:
+            return False
+        removed = self.by_id.keys() - by_id.keys()
+        self.by_id = by_id
+        self._tokens = {id: tuple(normalize(f'{c.name} {c.last_name}').split()) for id, c in by_id.items()}
+        self._index = sorted((t, id) for id, tokens in self._tokens.items() for t in tokens)
+        self.sorted = sorted(self.by_id.values(), key=lambda c: normalize(c.full_name))
+        logger.debug(f'Contact directory was updated: {len(raw_clients)} contacts, {len(removed)} removed.')
+
+    async def all(self) -> list[BXClient]:
+        await self.ensure()
+        return self.sorted
+
+    async def get(self, id: int | str) -> BXClient | None:
+        """
+        Ищет клиента по id. Если не нашли - догружаем изменения, вдруг клиент новый,
+        но не чаще раза в miss_interval, чтобы несуществующие id не гоняли запросы в битру.
+        """
+        await self.ensure()
+        id = int(id)
+        if id not in self.by_id and monotonic() - self.loaded_at > self.miss_interval:
+            await self.refresh()
+        return self.by_id.get(id, None)
+
+    async def search(self, query: str, offset: int = 0, limit: int = 50) -> tuple[list[BXClient], int]:
+        """Ищет клиентов, у которых каждое слово запроса - начало какого-то слова имени"""
+        await self.ensure()
+        words = normalize(query).split()
+        if not words:
+            return self.sorted[offset:offset + limit], len(self.sorted)
+        first, *rest = words
+        ids = {}
+        index = bisect_left(self._index, (first, ))
+        while index < len(self._index) and self._index[index][0].startswith(first):
+            ids[self._index[index][1]] = None
+            index += 1
+        found = [
+            self.by_id[id] for id in ids
+            if all(any(t.startswith(w) for t in self._tokens[id]) for w in rest)
+        ]
+        found.sort(key=lambda c: normalize(c.full_name))
+        return found[offset:offset + limit], len(found)
+
+
+CLIENTS = ContactDirectory(Settings.CLIENTS_TTL)
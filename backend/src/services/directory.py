@@ -0,0 +1,45 @@
+import asyncio
+from abc import ABC, abstractmethod
+from time import monotonic
+
+from src.logger import logger
+
+
+class Directory(ABC):
+    """
+    Базовый справочник, который загружается из битры и живет в памяти.
+    Первый раз ждем загрузки. Потом устаревшие данные отдаются сразу, а обновление идет в фоне.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.version = 0                        # Растет при каждой загрузке, которая изменила данные
+        self.loaded_at: float | None = None
+        self._task: asyncio.Task | None = None
+
+    @abstractmethod
+    async def load(self) -> bool | None:
+        """Загружает данные и перестраивает индексы. Возвращает False, если данные не изменились."""
+
+    async def _load(self):
+        if await self.load() is not False:
+            self.version += 1
+        self.loaded_at = monotonic()
+
+    def refresh(self) -> asyncio.Task:
+        """Запускает загрузку, если она еще не идет"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._load())
+            self._task.add_done_callback(self._log_error)
+        return self._task
+
+    def _log_error(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f'{self.__class__.__name__} loading failed: {task.exception()}')
+
+    async def ensure(self):
+        """Первый раз ждет загрузки, дальше - обновляет в фоне по истечении ttl"""
+        if self.loaded_at is None:
+            await self.refresh()
+        elif monotonic() - self.loaded_at > self.ttl:
+            self.refresh()
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from time import monotonic, time
+from typing import Iterable
+
+from src.core import Settings, BitrixClient
+from src.schemas.api import BXAppointment
+
+
+# Поля занятия, которые сохраняются в истории и восстанавливаются при откате
+FIELDS = ('specialist', 'patient', 'start', 'end', 'code', 'status')
+
+
+class AppointmentHistory:
+    """
+    Локальная история изменений занятий в sqlite. Только дописывается.
+    Перед каждым изменением занятия сохраняется его прежнее состояние (запись update),
+    откат дописывает запись rollback со ссылкой на отмененную запись.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.version = 0                    # Растет при каждой записи
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock, self._connection as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS history ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, appointment_id INTEGER NOT NULL, "
+                "kind TEXT NOT NULL, undoes INTEGER, created REAL NOT NULL, data TEXT)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS history_appointment ON history (appointment_id, kind, seq)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS history_undoes ON history (undoes)")
+
+    @staticmethod
+    def snapshot(item: dict | BXAppointment) -> dict:
+        """Состояние занятия в формате фронта: specialist, patient, start, end, code, status"""
+        if isinstance(item, dict):
+            item = BXAppointment.model_validate(item)
+        return {field: getattr(item, field) for field in FIELDS}
+
+    def _record(self, items: list[dict | BXAppointment]):
+        now = time()
+        rows = []
+        for item in items:
+            snapshot = self.snapshot(item)
+            id = item['id'] if isinstance(item, dict) else item.id
+            rows.append((int(id), 'update', None, now, json.dumps(snapshot, ensure_ascii=False)))
+        with self._lock, self._connection as connection:
+            connection.executemany(
+                "INSERT INTO history (appointment_id, kind, undoes, created, data) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self.version += 1
+
+    def _latest(self, id: int, steps: int) -> list[tuple[int, dict]]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT seq, data FROM history AS h "
+                "WHERE appointment_id = ? AND kind = 'update' "
+                "AND NOT EXISTS (SELECT 1 FROM history AS r WHERE r.undoes = h.seq) "
+                "ORDER BY seq DESC LIMIT ?",
+                (int(id), steps)
+            ).fetchall()
+        return [(seq, json.loads(data)) for seq, data in rows]
+
+    def _latest_many(self, ids: list[int]) -> dict[int, dict]:
+        result = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT appointment_id, data FROM history AS h "
+                    f"WHERE appointment_id IN ({', '.join('?' * len(chunk))}) AND kind = 'update' "
+                    "AND NOT EXISTS (SELECT 1 FROM history AS r WHERE r.undoes = h.seq) "
+                    "ORDER BY seq",
+                    chunk
+                ).fetchall()
+            # Более новые записи перезаписывают старые
+            result.update((id, json.loads(data)) for id, data in rows)
+        return result
+
+    def _revert(self, id: int, seqs: list[int]):
+        now = time()
+        with self._lock, self._connection as connection:
+            connection.executemany(
+                "INSERT INTO history (appointment_id, kind, undoes, created, data) VALUES (?, 'rollback', ?, ?, NULL)",
+                [(int(id), seq, now) for seq in seqs]
+            )
+            self.version += 1
+
+    async def record(self, *items: dict | BXAppointment):
+        """Сохраняет прежнее состояние занятий перед их изменением"""
+        if items:
+            await asyncio.to_thread(self._record, list(items))
+
+    async def latest(self, id: int, steps: int = 1) -> list[tuple[int, dict]]:
+        """До steps последних неотмененных записей занятия, от новых к старым: [(seq, состояние)]"""
+        return await asyncio.to_thread(self._latest, id, steps)
+
+    async def latest_many(self, ids: Iterable[int]) -> dict[int, dict]:
+        """Последняя неотмененная запись для каждого занятия, у которого есть история"""
+        return await asyncio.to_thread(self._latest_many, [int(i) for i in ids])
+
+    async def revert(self, id: int, *seqs: int):
+        """Отмечает записи отмененными"""
+        if seqs:
+            await asyncio.to_thread(self._revert, id, list(seqs))
+
+
+class CommentHistory:
+    """
+    Разобранные комменты history; из таймлайна битры, куда историю писали до локальной истории.
+    Для каждого занятия хранится результат разбора последнего коммента или None, если комментов нет.
+    Записи лежат в порядке загрузки: устаревшие и самые старые сверх max_size убираются с начала.
+    """
+
+    def __init__(self, ttl: int, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._cache: dict[int, tuple[dict | None, float]] = {}     # {id: (значения, когда загружены)}
+
+    async def get_many(self, ids: Iterable[int]) -> dict[int, dict | None]:
+        """Значения для истории по занятиям. Чего нет в кэше - загружается одним проходом."""
+        now = monotonic()
+        ids = [int(i) for i in ids]
+        missing = [id for id in ids if id not in self._cache or now - self._cache[id][1] > self.ttl]
+        if missing:
+            parsed: dict[int, dict | None] = dict.fromkeys(missing)
+            seen = set()
+            for comment in await BitrixClient.get_history_comments(missing):
+                id = int(comment.get('ENTITY_ID', 0))
+                if id not in parsed or id in seen:
+                    continue
+                # Комменты от новых к старым, берем первый разобранный коммент history; для каждого занятия.
+                # Префикс проверяется и здесь: на фильтр битры по тексту коммента не полагаемся.
+                previous = BXAppointment.parse_history_comment(comment.get('COMMENT', ''))
+                if previous is not None:
+                    seen.add(id)
+                    parsed[id] = previous
+            for id, previous in parsed.items():
+                self._cache.pop(id, None)
+                self._cache[id] = (previous, now)
+        result = {id: self._cache[id][0] for id in ids}
+        self._evict(now)
+        return result
+
+    def _evict(self, now: float):
+        while self._cache:
+            id, (_, loaded) = next(iter(self._cache.items()))
+            if now - loaded <= self.ttl and len(self._cache) <= self.max_size:
+                break
+            del self._cache[id]
+
+    def invalidate(self, *ids: int):
+        for id in ids:
+            self._cache.pop(int(id), None)
+
+
+HISTORY = AppointmentHistory(Settings.HISTORY_PATH)
+HISTORY_COMMENTS = CommentHistory(Settings.HISTORY_COMMENTS_TTL, Settings.HISTORY_COMMENTS_MAX_SIZE)
+
+
+async def fill_previous(*appointments: BXAppointment):
+    """
+    Заполняет значения для истории: из локальной истории,
+    а для занятий без нее - из комментов history; в битре.
+    """
+    ids = [a.id for a in appointments]
+    previous = await HISTORY.latest_many(ids)
+    rest = [id for id in ids if id not in previous]
+    if rest:
+        previous.update((id, values) for id, values in (await HISTORY_COMMENTS.get_many(rest)).items() if values)
+    for appointment in appointments:
+        if appointment.id in previous:
+            appointment.set_previous(previous[appointment.id])
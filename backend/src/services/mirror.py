@@ -0,0 +1,387 @@
+import asyncio
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from time import time
+from typing import Iterable
+from uuid import uuid4
+
+from src.core import Settings, BXConstants, BitrixClient, Lane, CURRENT_LANE
+from src.schemas.api import parse_datetime
+from src.logger import logger
+from .broker import ChangeBroker, Subscription
+
+
+def _timestamp(value: str | None) -> float | None:
+    """Переводит дату в формате iso в таймстамп. Даты без таймзоны считаются локальными."""
+    if not value:
+        return None
+    try:
+        return parse_datetime(value).timestamp()
+    except ValueError:
+        return None
+
+
+class _Table:
+    """Описывает таблицу зеркала для смарт-процесса"""
+
+    __slots__ = ('name', 'entityTypeId', 'specialist', 'start', 'end')
+
+    def __init__(self, name: str, entityTypeId: int, specialist: str, start: str, end: str):
+        self.name = name
+        self.entityTypeId = entityTypeId
+        self.specialist = specialist
+        self.start = start              # Поле битры, по которому ищем начало периода
+        self.end = end                  # Поле битры, по которому ищем конец периода
+
+    def row(self, item: dict) -> tuple:
+        return (
+            int(item['id']),
+            item.get(self.specialist),
+            _timestamp(item.get(self.start)),
+            _timestamp(item.get(self.end)),
+            item.get('updatedTime'),
+            json.dumps(item, ensure_ascii=False)
+        )
+
+
+class Mirror:
+    """
+    Локальная копия смарт-процессов занятий и графиков в sqlite.
+    Догоняет битру по updatedTime, а наши собственные изменения пишутся сюда сразу.
+    """
+
+    appointments = _Table(
+        'appointments',
+        BXConstants.appointment.entityTypeId,
+        BXConstants.appointment.uf.specialist,
+        BXConstants.appointment.uf.start,
+        BXConstants.appointment.uf.end
+    )
+    schedules = _Table(
+        'schedules',
+        BXConstants.schedule.entityTypeId,
+        BXConstants.schedule.uf.specialist,
+        BXConstants.schedule.uf.date,
+        BXConstants.schedule.uf.date
+    )
+
+    def __init__(self, path: str):
+        self.tables = {t.entityTypeId: t for t in (self.appointments, self.schedules)}
+        self.path = path
+        self.ready = False                  # Первая синхронизация завершена, можно читать
+        self.versions = {t: 0 for t in self.tables}     # {entityTypeId: растет при каждом изменении таблицы}
+        self._lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._create_tables()
+        self.epoch = self._epoch()          # id базы, входит в курсор изменений
+
+    def _create_tables(self):
+        with self._lock, self._connection as connection:
+            for table in (self.appointments, self.schedules):
+                connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table.name} ("
+                    "id INTEGER PRIMARY KEY, specialist INTEGER, start_ts REAL, end_ts REAL, "
+                    "updated TEXT, data TEXT NOT NULL)"
+                )
+                connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {table.name}_specialist_start "
+                    f"ON {table.name} (specialist, start_ts)"
+                )
+                connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {table.name}_start ON {table.name} (start_ts)"
+                )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS watermarks (entity_type INTEGER PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            # Журнал изменений для дельта-синхронизации фронта: новое и прежнее положение элемента
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS changes ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, entity_type INTEGER NOT NULL, item_id INTEGER NOT NULL, "
+                "deleted INTEGER NOT NULL, start_ts REAL, end_ts REAL, old_start_ts REAL, old_end_ts REAL, "
+                "created REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS changes_created ON changes (created)")
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _epoch(self) -> str:
+        """
+        Id базы, создается вместе с ней. Если базу удалили или подменили, нумерация журнала начинается заново,
+        и курсор со старым id не должен совпасть с курсором новой базы.
+        """
+        with self._lock, self._connection as connection:
+            connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (uuid4().hex[:12], ))
+            return connection.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+
+    def _format_cursor(self, seq: int) -> str:
+        return f'{self.epoch}-{seq}'
+
+    def _parse_cursor(self, cursor: str) -> int | None:
+        """Номер записи журнала из курсора. None - курсор от другой базы или испорчен."""
+        epoch, _, seq = cursor.rpartition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    # Синхронизация с битрой
+    def start(self):
+        """Запускает фоновую синхронизацию"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def run(self):
+        """Периодически подтягивает изменения из битры"""
+        CURRENT_LANE.set(Lane.BACKGROUND)
+        while True:
+            try:
+                await self.sync()
+                if not self.ready:
+                    logger.info('Mirror is synchronized.')
+                self.ready = True
+            except Exception as exc:
+                logger.error(f'Mirror synchronization failed: {exc}')
+            await asyncio.sleep(Settings.MIRROR_SYNC_INTERVAL)
+
+    async def sync(self):
+        """Забирает из битры только элементы, измененные после последней синхронизации"""
+        await asyncio.gather(*(self._sync_table(t) for t in (self.appointments, self.schedules)))
+        await asyncio.to_thread(self._prune_changes, time() - Settings.CHANGES_RETENTION)
+
+    async def _sync_table(self, table: _Table):
+        watermark = await asyncio.to_thread(self._get_watermark, table)
+        items = await BitrixClient.get_updated_items(table.entityTypeId, watermark)
+        if not items:
+            return
+        newest = max(items, key=lambda i: _timestamp(i.get('updatedTime')) or 0).get('updatedTime')
+        if watermark is not None and (_timestamp(newest) or 0) < (_timestamp(watermark) or 0):
+            newest = watermark
+        await self._write(self._upsert, table, items, newest)
+        logger.debug(f'Mirror: {len(items)} items of {table.name} were synchronized.')
+
+    def _get_watermark(self, table: _Table) -> str | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM watermarks WHERE entity_type = ?", (table.entityTypeId, )
+            ).fetchone()
+        return row[0] if row else None
+
+    def _upsert(self, table: _Table, items: Iterable[dict], watermark: str | None = None) -> list[dict]:
+        rows = [table.row(i) for i in items if i.get('id') is not None]
+        events = []
+        with self._lock, self._connection as connection:
+            existing = self._existing(connection, table, [r[0] for r in rows])
+            changed = [r for r in rows if r[0] not in existing or existing[r[0]][0] != r[4]]
+            if changed:
+                self.versions[table.entityTypeId] += 1
+                now = time()
+                self._log_changes(connection, [
+                    (table.entityTypeId, r[0], 0, r[2], r[3], *existing.get(r[0], (None, ) * 4)[1:3], now)
+                    for r in changed
+                ])
+                cursor = self._format_cursor(self._last_seq(connection))
+                events = [
+                    self._event(table, cursor, r[0], 'upsert', (r[1], r[2], r[3]), existing.get(r[0]))
+                    for r in changed
+                ]
+            connection.executemany(
+                f"INSERT OR REPLACE INTO {table.name} (id, specialist, start_ts, end_ts, updated, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            if watermark is not None:
+                connection.execute(
+                    "INSERT OR REPLACE INTO watermarks (entity_type, value) VALUES (?, ?)",
+                    (table.entityTypeId, watermark)
+                )
+        return events
+
+    def _delete(self, table: _Table, ids: Iterable[int | str]) -> list[dict]:
+        ids = [int(i) for i in ids]
+        with self._lock, self._connection as connection:
+            existing = self._existing(connection, table, ids)
+            connection.executemany(f"DELETE FROM {table.name} WHERE id = ?", [(i, ) for i in existing])
+            if not existing:
+                return []
+            self.versions[table.entityTypeId] += 1
+            now = time()
+            self._log_changes(connection, [
+                (table.entityTypeId, id, 1, None, None, start, end, now)
+                for id, (_, start, end, _) in existing.items()
+            ])
+            cursor = self._format_cursor(self._last_seq(connection))
+        return [self._event(table, cursor, id, 'delete', None, old) for id, old in existing.items()]
+
+    @staticmethod
+    def _existing(connection: sqlite3.Connection, table: _Table, ids: list[int]) -> dict[int, tuple]:
+        """Текущие updatedTime, положение и специалист элементов: {id: (updated, start_ts, end_ts, specialist)}"""
+        existing = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows = connection.execute(
+                f"SELECT id, updated, start_ts, end_ts, specialist FROM {table.name} "
+                f"WHERE id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            existing.update((row[0], row[1:]) for row in rows)
+        return existing
+
+    @staticmethod
+    def _last_seq(connection: sqlite3.Connection) -> int:
+        row = connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _event(table: _Table, cursor: str, id: int, action: str, new: tuple | None, old: tuple | None) -> dict:
+        """Событие для подписчиков: новое и прежнее положение (специалист, начало, конец)"""
+        positions = []
+        if new is not None:
+            positions.append(new)
+        if old is not None:
+            positions.append((old[3], old[1], old[2]))
+        return {'cursor': cursor, 'entity': table.name, 'id': id, 'action': action, 'positions': positions}
+
+    async def _write(self, func, *args):
+        """Пишет в зеркало в отдельном потоке и рассылает события изменений подписчикам"""
+        events = await asyncio.to_thread(func, *args)
+        if events:
+            BROKER.publish(events)
+
+    @staticmethod
+    def _log_changes(connection: sqlite3.Connection, rows: list[tuple]):
+        connection.executemany(
+            "INSERT INTO changes (entity_type, item_id, deleted, start_ts, end_ts, old_start_ts, old_end_ts, created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+    def _prune_changes(self, before: float):
+        with self._lock, self._connection as connection:
+            connection.execute("DELETE FROM changes WHERE created < ?", (before, ))
+
+    def _changes(self, since: str, start: str, end: str) -> tuple[str, dict, dict] | None:
+        """
+        Изменения в периоде после курсора since: (новый курсор, {entityTypeId: [элементы]}, {entityTypeId: [id]}).
+        Удаленные и ушедшие из периода элементы попадают в список id.
+        None - журнал после since уже очищен или курсор не от этой базы.
+        """
+        window = (_timestamp(start), _timestamp(end))
+        since_seq = self._parse_cursor(since)
+        with self._lock:
+            connection = self._connection
+            cursor = self._last_seq(connection)
+            oldest = connection.execute("SELECT MIN(seq) FROM changes").fetchone()[0] or cursor + 1
+            if since_seq is None or since_seq > cursor or since_seq + 1 < oldest:
+                return None
+            changed = connection.execute(
+                "SELECT entity_type, item_id FROM changes WHERE seq > ? AND seq <= ? AND ("
+                "(start_ts >= ? AND end_ts <= ?) OR (old_start_ts >= ? AND old_end_ts <= ?)) "
+                "GROUP BY entity_type, item_id",
+                (since_seq, cursor, *window, *window)
+            ).fetchall()
+            items, deleted = {t: [] for t in self.tables}, {t: [] for t in self.tables}
+            by_table: dict[int, list[int]] = {}
+            for entity_type, item_id in changed:
+                by_table.setdefault(entity_type, []).append(item_id)
+            for entity_type, ids in by_table.items():
+                table = self.tables[entity_type]
+                current = {}
+                for i in range(0, len(ids), 500):
+                    chunk = ids[i:i + 500]
+                    current.update((id, (data, start_ts, end_ts)) for id, data, start_ts, end_ts in connection.execute(
+                        f"SELECT id, data, start_ts, end_ts FROM {table.name} "
+                        f"WHERE id IN ({', '.join('?' * len(chunk))})",
+                        chunk
+                    ).fetchall())
+                for id in sorted(ids):
+                    data, start_ts, end_ts = current.get(id, (None, None, None))
+                    if data is not None and start_ts is not None and end_ts is not None \
+                            and start_ts >= window[0] and end_ts <= window[1]:
+                        items[entity_type].append(json.loads(data))
+                    else:
+                        deleted[entity_type].append(id)
+        return self._format_cursor(cursor), items, deleted
+
+    def _cursor(self) -> str:
+        with self._lock:
+            return self._format_cursor(self._last_seq(self._connection))
+
+    def _versions(self, table: _Table, start: str, end: str) -> dict[int, str | None]:
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT id, updated FROM {table.name} WHERE start_ts >= ? AND end_ts <= ?",
+                (_timestamp(start), _timestamp(end))
+            ).fetchall()
+        return dict(rows)
+
+    def _select(self, table: _Table, start: str, end: str, spec_ids: Iterable | None) -> list[dict]:
+        query = f"SELECT data FROM {table.name} WHERE start_ts >= ? AND end_ts <= ?"
+        params: list = [_timestamp(start), _timestamp(end)]
+        if spec_ids is not None:
+            spec_ids = [int(s) for s in spec_ids]
+            query += f" AND specialist IN ({', '.join('?' * len(spec_ids))})"
+            params.extend(spec_ids)
+        query += " ORDER BY id"
+        with self._lock:
+            rows = self._connection.execute(query, params).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    # Запись изменений, сделанных через наше API или пришедших событиями битры
+    async def save(self, entityTypeId: int, *items: dict):
+        await self._write(self._upsert, self.tables[entityTypeId], items)
+
+    async def delete(self, entityTypeId: int, *ids: int | str):
+        await self._write(self._delete, self.tables[entityTypeId], ids)
+
+    async def save_appointments(self, *items: dict):
+        await self._write(self._upsert, self.appointments, items)
+
+    async def save_schedules(self, *items: dict):
+        await self._write(self._upsert, self.schedules, items)
+
+    async def delete_appointments(self, *ids: int | str):
+        await self._write(self._delete, self.appointments, ids)
+
+    async def delete_schedules(self, *ids: int | str):
+        await self._write(self._delete, self.schedules, ids)
+
+    async def get_changes(self, since: str, start: str, end: str) -> tuple[str, dict, dict] | None:
+        """Изменения элементов периода после курсора since. None - курсор устарел, нужна полная загрузка."""
+        return await asyncio.to_thread(self._changes, since, start, end)
+
+    async def get_cursor(self) -> str:
+        """Текущий курсор журнала изменений"""
+        return await asyncio.to_thread(self._cursor)
+
+    def subscribe(self, start: str, end: str, specialists: Iterable[int] | None = None) -> Subscription:
+        """Подписка на изменения элементов периода"""
+        return BROKER.subscribe(_timestamp(start) or 0, _timestamp(end) or float('inf'), specialists)
+
+    async def get_versions(self, entityTypeId: int, start: str, end: str) -> dict[int, str | None]:
+        """Возвращает {id: updatedTime} элементов за период"""
+        return await asyncio.to_thread(self._versions, self.tables[entityTypeId], start, end)
+
+    # Чтение. Пока зеркало не синхронизировано - читаем из битры.
+    async def get_appointments(self, start: str, end: str, spec_ids: Iterable | None = None) -> list[dict]:
+        if spec_ids is not None and not spec_ids:
+            return []
+        if not self.ready:
+            if spec_ids is None:
+                return await BitrixClient.get_all_appointments(start, end)
+            return await BitrixClient.get_specialists_appointments(start, end, spec_ids)
+        return await asyncio.to_thread(self._select, self.appointments, start, end, spec_ids)
+
+    async def get_schedules(self, start: str, end: str, spec_ids: Iterable | None = None) -> list[dict]:
+        if spec_ids is not None and not spec_ids:
+            return []
+        if not self.ready:
+            if spec_ids is None:
+                return await BitrixClient.get_all_schedules(start, end)
+            return await BitrixClient.get_specialists_schedules(start, end, spec_ids)
+        return await asyncio.to_thread(self._select, self.schedules, start, end, spec_ids)
+
+
+BROKER = ChangeBroker(Settings.STREAM_QUEUE_SIZE)
+MIRROR = Mirror(Settings.MIRROR_PATH)
@@ -2,6 +2,9 @@ import asyncio
 
 from src.core import BXConstants, BitrixClient
 from src.logger import logger
+from .mirror import MIRROR
+from .specialists import SPECIALISTS
+from .clients import CLIENTS
 
 
 async def on_startup():
@@ -10,6 +13,9 @@ async def on_startup():
     await asyncio.gather(
         update_constants()
     )
+    MIRROR.start()
+    SPECIALISTS.refresh()
+    CLIENTS.refresh()
 
 
 async def update_constants():
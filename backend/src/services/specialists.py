@@ -0,0 +1,55 @@
+from typing import Iterable
+
+from src.core import Settings, BXConstants, BitrixClient
+from src.schemas.api import BXSpecialist
+from src.logger import logger
+from .directory import Directory
+
+
+class SpecialistDirectory(Directory):
+    """Справочник специалистов с индексами по id и по подразделению."""
+
+    def __init__(self, ttl: int):
+        super().__init__(ttl)
+        self.specialists: list[BXSpecialist] = []               # В порядке сортировки для фронта
+        self.by_id: dict[int, BXSpecialist] = {}
+        self.by_department: dict[str, list[BXSpecialist]] = {}  # {"ЛМ": [BXSpecialist, ...]}
+
+    async def load(self):
+        """
+        Загружает всех активных специалистов всех подразделений и перестраивает индексы.
+        Если ничего не изменилось - False, версия справочника (и ETag) остается прежней.
+        """
+        raw_specialists = await BitrixClient.get_specialists_by_department(BXConstants.departments.values())
+        specialists = [BXSpecialist.model_validate(s) for s in raw_specialists]
+        specialists.sort(key=lambda s: s.sort_index)
+        if self.loaded_at is not None and specialists == self.specialists:
+            return False
+        by_department = {}
+        for specialist in specialists:
+            for department in specialist.departments:
+                by_department.setdefault(department, []).append(specialist)
+        self.specialists = specialists
+        self.by_id = {s.id: s for s in specialists}
+        self.by_department = by_department
+        logger.debug(f'Specialist directory was loaded: {len(specialists)} specialists.')
+
+    async def all(self) -> list[BXSpecialist]:
+        await self.ensure()
+        return self.specialists
+
+    async def get(self, id: int) -> BXSpecialist | None:
+        await self.ensure()
+        return self.by_id.get(int(id), None)
+
+    async def get_by_departments(self, codes: Iterable[str]) -> list[BXSpecialist]:
+        """Специалисты, работающие хотя бы в одном из подразделений"""
+        await self.ensure()
+        result = {}
+        for code in codes:
+            for specialist in self.by_department.get(code, ()):
+                result[specialist.id] = specialist
+        return list(result.values())
+
+
+SPECIALISTS = SpecialistDirectory(Settings.SPECIALISTS_TTL)
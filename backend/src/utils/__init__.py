@@ -1,3 +1,5 @@
-from .batch_builder import BatchBuilder
-from .funcs import handle_http_exception, extract
+from .batch_builder import BatchBuilder, BatchTemplate
+from .funcs import handle_http_exception, extract, batch_items, get_select, make_etag, items_etag, not_modified
 from .interval import Interval
+from .single_flight import SingleFlight
+from .columnar import COLUMNAR_MEDIA_TYPE, wants_columnar, to_columns, columnar_response
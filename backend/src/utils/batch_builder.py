@@ -1,6 +1,50 @@
+from functools import lru_cache
+from typing import Iterable
 from urllib.parse import quote as url_quote
 
 
+@lru_cache(maxsize=4096)
+def _child(path: str, key) -> str:
+    """Путь вложенного параметра: fields + ufCrm3Code -> fields[ufCrm3Code]. Ключи кодируются один раз."""
+    return f"{path}[{url_quote(str(key))}]"
+
+
+def _encode(path: str, value, parts: list[str]):
+    """Добавляет в parts закодированные пары путь=значение для значения любой вложенности"""
+    match value:
+        case dict():
+            for key, sub_value in value.items():
+                _encode(_child(path, key), sub_value, parts)
+        case tuple() | list():
+            for index, sub_value in enumerate(value):
+                _encode(_child(path, index), sub_value, parts)
+        case _:
+            parts.append(f"&{path}={url_quote(str(value))}")
+
+
+class BatchTemplate:
+    """
+    Скомпилированная батч команда. Метод и постоянные параметры закодированы заранее,
+    при сборке кодируются только переменные параметры.
+    """
+
+    __slots__ = ("prefix", "paths")
+
+    def __init__(self, method: str, params: dict, variables: Iterable[str]):
+        parts = [f"{method}?"]
+        for key, value in params.items():
+            _encode(url_quote(str(key)), value, parts)
+        self.prefix = "".join(parts)
+        self.paths = {name: url_quote(name) for name in variables}
+
+    def build(self, **values) -> str:
+        """Возвращает батч-запрос в виде строки с подставленными значениями"""
+        parts = [self.prefix]
+        for name, value in values.items():
+            _encode(self.paths[name], value, parts)
+        return "".join(parts)
+
+
 class BatchBuilder:
     """Создает батч запрос"""
 
@@ -12,49 +56,14 @@ class BatchBuilder:
 
     def build(self) -> str:
         """Возвращает батч-запрос в виде строки"""
-        batch = f"{self.method}?"
+        parts = [f"{self.method}?"]
         for cmd, cmd_params in self.params.items():
-            match cmd_params:
-                case dict() as params:
-                    batch += self._get_subbatch_from_dict(cmd, params)
-                case tuple() | list() as params:
-                    batch += self._get_subbatch_from_iterable(cmd, params)
-                case params:
-                    batch += self._get_subbatch(cmd, params)
-        return batch
-
-    @staticmethod
-    def _get_subbatch_from_dict(cmd, params: dict) -> str:
-        """Возвращает подзапрос для словарей"""
-        subbatch = ""
-        for key, value in params.items():
-            key = url_quote(str(key))
-            if isinstance(value, tuple | list):
-                for sub_cmd in BatchBuilder._iterable_iterator(value):
-                    subbatch += f"&{cmd}[{key}]{sub_cmd}"
-            else:
-                value = url_quote(str(value))
-                subbatch += f"&{cmd}[{key}]={value}"
-        return subbatch
-
-    @staticmethod
-    def _get_subbatch_from_iterable(cmd, params: list | tuple) -> str:
-        """Возвращает подзапрос для словарей"""
-        subbatch = ""
-        for sub_cmd in BatchBuilder._iterable_iterator(params):
-            subbatch += f"&{cmd}{sub_cmd}"
-        return subbatch
-
-    @staticmethod
-    def _iterable_iterator(iterable: tuple | list):
-        """Генератор строк из кортежа или списка"""
-        for index, value in enumerate(iterable):
-            value = url_quote(str(value))
-            yield f"[{index}]={value}"
-
-    @staticmethod
-    def _get_subbatch(cmd, params: int | float | str) -> str:
-        """Возвращает подзапрос для этих типов данных"""
-        params = url_quote(str(params))
-        subbatch = f"&{cmd}={params}"
-        return subbatch
+            _encode(url_quote(str(cmd)), cmd_params, parts)
+        return "".join(parts)
+
+    def compile(self, *variables: str) -> BatchTemplate:
+        """
+        Компилирует шаблон: текущие params - постоянная часть команды,
+        variables - имена параметров, которые передаются в BatchTemplate.build.
+        """
+        return BatchTemplate(self.method, self.params, variables)
@@ -0,0 +1,59 @@
+import json
+from typing import Iterable
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+
+# Тип содержимого, которым фронт просит колоночный ответ через Accept
+COLUMNAR_MEDIA_TYPE = 'application/vnd.appointplan.columnar+json'
+
+
+def wants_columnar(request: Request) -> bool:
+    """Клиент явно попросил колоночный формат"""
+    return COLUMNAR_MEDIA_TYPE in request.headers.get('accept', '')
+
+
+def dumps(value) -> bytes:
+    """Компактный json: без пробелов и без экранирования кириллицы"""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def to_columns(
+    items: list[BaseModel],
+    dictionaries: dict[str, Iterable[str]] | None = None,
+    same_as: dict[str, str] | None = None
+) -> dict:
+    """
+    Колоночное представление списка моделей: по массиву на поле.
+    dictionaries - {имя словаря: поля}: значения таких полей заменяются индексами в общем словаре,
+    например {'code': ('code', 'old_code')} -> columns.code = [0, 1, 0], dictionaries.code = ['L', 'S'].
+    same_as - {поле: основное поле}: значение, совпадающее со значением основного поля, передается как null.
+    """
+    if not items:
+        return {'count': 0, 'dictionaries': {name: [] for name in dictionaries or {}}, 'columns': {}}
+    fields = list(type(items[0]).model_fields)
+    columns = {name: [getattr(item, name) for item in items] for name in fields}
+    for field, main in (same_as or {}).items():
+        columns[field] = [None if value == base else value for value, base in zip(columns[field], columns[main])]
+    encoded = {}
+    for name, dictionary_fields in (dictionaries or {}).items():
+        index: dict = {}
+        for field in dictionary_fields:
+            columns[field] = [
+                None if value is None else index.setdefault(value, len(index))
+                for value in columns[field]
+            ]
+        encoded[name] = list(index)
+    return {'count': len(items), 'dictionaries': encoded, 'columns': columns}
+
+
+def columnar_response(
+    items: list[BaseModel],
+    dictionaries: dict[str, Iterable[str]] | None = None,
+    same_as: dict[str, str] | None = None,
+    headers: dict | None = None
+) -> Response:
+    """Ответ в колоночном формате"""
+    content = dumps(to_columns(items, dictionaries, same_as))
+    return Response(content, media_type=COLUMNAR_MEDIA_TYPE, headers=headers)
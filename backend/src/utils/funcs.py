@@ -1,10 +1,19 @@
 import asyncio
+import hashlib
+from uuid import uuid4
+from fastapi import Request, Response
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import HTTPException
+from pydantic import BaseModel
 
 from src.logger import logger
 
 
+# Версии справочников и зеркала живут в памяти и после перезапуска начинаются заново.
+# Чтобы ETag старого процесса не совпал с новым при той же версии, в каждый тег подмешивается id запуска.
+BOOT_ID = uuid4().hex
+
+
 async def handle_http_exception(request, exc: HTTPException) -> JSONResponse:
     """Обрабатывает и логгирует http исключения"""
     async def coro():
@@ -14,6 +23,21 @@ async def handle_http_exception(request, exc: HTTPException) -> JSONResponse:
     return JSONResponse(status_code=exc.status_code, content={'detail': exc.detail})
 
 
+def batch_items(result: list | dict) -> list[dict]:
+    """Достает элементы смарт-процесса из результата батча команд crm.item.add/update"""
+    values = result.values() if isinstance(result, dict) else result
+    return [v['item'] for v in values if isinstance(v, dict) and v.get('item')]
+
+
+def get_select(model: type[BaseModel], *extra: str) -> list[str]:
+    """Список полей битры для select: алиасы полей модели и дополнительные поля"""
+    fields = dict.fromkeys(extra)
+    for field in model.model_fields.values():
+        if isinstance(field.validation_alias, str):
+            fields[field.validation_alias] = None
+    return list(fields)
+
+
 def extract(obj) -> dict:
     """Используется для извлечения данных из объекта в словарь"""
     result = {}
@@ -32,3 +56,27 @@ def extract(obj) -> dict:
         else:
             result[key] = value
     return result
+
+
+def make_etag(*parts) -> str:
+    """Сильный ETag из версий данных, параметров запроса и id запуска процесса"""
+    digest = hashlib.blake2b(repr((BOOT_ID, parts)).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def items_etag(items: list[dict], *parts) -> str:
+    """ETag по id и updatedTime элементов битры"""
+    return make_etag(*parts, [(i.get('id'), i.get('updatedTime')) for i in items])
+
+
+def not_modified(request: Request, response: Response, etag: str) -> Response | None:
+    """
+    Если у клиента актуальная версия (If-None-Match) - возвращает ответ 304.
+    Иначе проставляет ETag в ответ и возвращает None.
+    """
+    if_none_match = request.headers.get('if-none-match', '')
+    tags = {t.strip().removeprefix('W/') for t in if_none_match.split(',')}
+    if etag in tags or '*' in tags:
+        return Response(status_code=304, headers={'ETag': etag})
+    response.headers['ETag'] = etag
+    return None
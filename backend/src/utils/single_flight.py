@@ -0,0 +1,55 @@
+import asyncio
+from functools import wraps
+
+
+def _freeze(value):
+    """Приводит аргументы к хэшируемому виду, чтобы использовать их как ключ"""
+    match value:
+        case list() | tuple():
+            return tuple(_freeze(v) for v in value)
+        case set() | frozenset():
+            return frozenset(value)
+        case dict():
+            return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+        case _:
+            hash(value)
+            return value
+
+
+class SingleFlight:
+    """
+    Декоратор для корутин чтения.
+    Одновременные вызовы с одинаковыми аргументами ждут один и тот же запрос.
+    Результат общий для всех вызвавших, поэтому его нельзя менять на месте.
+    """
+
+    def __init__(self):
+        self.counters: dict[str, dict[str, int]] = {}
+        self._inflight: dict[tuple, asyncio.Task] = {}
+
+    def __call__(self, func):
+        name = func.__qualname__
+        counter = self.counters[name] = {'hits': 0, 'misses': 0}
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                key = (name, _freeze(args), _freeze(kwargs))
+            except TypeError:
+                return await func(*args, **kwargs)
+            task = self._inflight.get(key, None)
+            if task is not None:
+                counter['hits'] += 1
+                return await asyncio.shield(task)
+            counter['misses'] += 1
+            task = self._inflight[key] = asyncio.ensure_future(func(*args, **kwargs))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            return await asyncio.shield(task)
+
+        return wrapper
+
+    def stats(self) -> dict:
+        """Счетчики попаданий и промахов по каждому методу и в сумме"""
+        hits = sum(c['hits'] for c in self.counters.values())
+        misses = sum(c['misses'] for c in self.counters.values())
+        return {'hits': hits, 'misses': misses, 'in_flight': len(self._inflight), 'methods': self.counters}
@@ -0,0 +1,50 @@
+"""
+Сравнение скорости сборки 1000 команд crm.item.update: BatchBuilder.build и скомпилированный шаблон.
+Запуск из папки backend: python -m tests.manual.batch_benchmark
+"""
+from timeit import repeat
+
+import src.core     # noqa: F401 - src.utils импортируется после src.core
+from src.utils import BatchBuilder
+
+
+ENTITY_TYPE_ID = 1036
+COMMANDS = 1000
+ROUNDS = 20
+
+
+def make_fields(i: int) -> dict:
+    start = 1735714800000 + i * 604800000
+    return {
+        'ufCrm5Intervals': [f'{start + h * 3600000}:{start + (h + 1) * 3600000}' for h in range(8)],
+        'assignedById': 1 + i % 30,
+        'ufCrm5Date': '2025-01-01T00:00:00+03:00',
+    }
+
+
+FIELDS = [make_fields(i) for i in range(COMMANDS)]
+
+
+def with_builder() -> dict:
+    builder = BatchBuilder('crm.item.update')
+    batches = {}
+    for i, fields in enumerate(FIELDS):
+        builder.params = {'entityTypeId': ENTITY_TYPE_ID, 'id': i, 'fields': fields}
+        batches[i] = builder.build()
+    return batches
+
+
+def with_template() -> dict:
+    command = BatchBuilder('crm.item.update', {'entityTypeId': ENTITY_TYPE_ID}).compile('id', 'fields')
+    return {i: command.build(id=i, fields=fields) for i, fields in enumerate(FIELDS)}
+
+
+def main():
+    assert with_builder() == with_template()
+    for name, func in (('BatchBuilder.build', with_builder), ('BatchTemplate.build', with_template)):
+        best = min(repeat(func, number=1, repeat=ROUNDS))
+        print(f'{name:20} {best * 1000:8.2f} ms / {COMMANDS} commands, {COMMANDS / best:10.0f} commands/s')
+
+
+if __name__ == '__main__':
+    main()
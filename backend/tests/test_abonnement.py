@@ -0,0 +1,41 @@
+import asyncio
+import pytest
+
+from src.core import BitrixClient
+from src.services.abonnement import AbonnementControlQueue
+
+
+@pytest.fixture
+def launches(monkeypatch) -> list[tuple]:
+    launches = []
+
+    async def run_abonnement_control(*ids):
+        launches.append(ids)
+    monkeypatch.setattr(BitrixClient, 'run_abonnement_control', run_abonnement_control)
+    return launches
+
+
+class TestAbonnementControlQueue:
+
+    @pytest.mark.asyncio
+    async def test_debounce(self, launches: list):
+        queue = AbonnementControlQueue(delay=0.1)
+        queue.schedule(1)
+        queue.schedule(2, 3)
+        await asyncio.sleep(0.04)
+        queue.schedule(1)
+        assert queue.stats()['queue_depth'] == 3
+        await asyncio.sleep(0.08)
+        # 2 и 3 запущены одним батчем, 1 отложен повторной постановкой
+        assert launches == [(2, 3)]
+        await asyncio.sleep(0.05)
+        assert launches == [(2, 3), (1, )]
+        assert queue.stats() == {'queue_depth': 0, 'in_flight': 0, 'launched': 3, 'coalesced': 1}
+
+    @pytest.mark.asyncio
+    async def test_flush(self, launches: list):
+        queue = AbonnementControlQueue(delay=60)
+        queue.schedule(5, 6, 5)
+        await queue.flush()
+        assert launches == [(6, 5)]
+        assert queue.stats()['queue_depth'] == 0
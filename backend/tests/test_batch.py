@@ -0,0 +1,185 @@
+import asyncio
+import pytest
+
+from src.core.batch import BatchExecutor, BatchError, split_commands, command_size
+
+
+class FakeBitrix:
+    """Имитирует batch метод битры"""
+
+    def __init__(self, as_list: bool = False, errors: dict | None = None):
+        self.as_list = as_list
+        self.errors = errors or {}      # {ключ: [код ошибки на 1-й попытке, на 2-й, ...]}
+        self.active = 0
+        self.max_active = 0
+        self.calls = 0
+        self.sent: list[list] = []
+
+    async def call(self, method: str, params: dict, raw: bool = False):
+        self.calls += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        cmd: dict = params['cmd']
+        self.sent.append(list(cmd))
+        # Первая порция отвечает медленнее остальных
+        await asyncio.sleep(0.05 if '0' in map(str, cmd) else 0.01)
+        self.active -= 1
+        result, result_error = {}, {}
+        for k in cmd:
+            codes = self.errors.get(k, [])
+            code = codes.pop(0) if codes else None
+            if code:
+                result_error[str(k)] = {'error': code, 'error_description': 'fake'}
+            else:
+                result[str(k)] = f'result_{k}'
+        if self.as_list and not result_error:
+            result = list(result.values())
+        return {'result': {'result': result, 'result_error': result_error or []}}
+
+
+class TestBatchExecutor:
+
+    def test_split(self):
+        executor = BatchExecutor(FakeBitrix(), 50, 5)
+        chunks = executor.split({i: 'cmd' for i in range(120)})
+        assert [len(c) for c in chunks] == [50, 50, 20]
+
+    def test_split_by_size(self):
+        small, large = 'crm.item.get?id=1', 'crm.item.update?' + 'x' * 1000
+        cmd = {0: small, 1: small, 2: large, 3: small, 4: small, 5: small}
+        budget = command_size(0, small) * 3
+        chunks = split_commands(cmd, 50, budget)
+        # Большая команда уходит отдельно, маленькие плотно упакованы, порядок сохранен
+        assert chunks == [{0: small, 1: small}, {2: large}, {3: small, 4: small, 5: small}]
+        assert split_commands(cmd, 50) == [cmd]
+
+    @pytest.mark.asyncio
+    async def test_dict_order(self):
+        bitrix = FakeBitrix()
+        executor = BatchExecutor(bitrix, 10, 3)
+        result = await executor.run({i: 'cmd' for i in range(95)})
+        assert list(result) == list(range(95))
+        assert result[42] == 'result_42'
+        assert bitrix.max_active == 3
+        assert len(executor.latencies) == 10
+
+    @pytest.mark.asyncio
+    async def test_list_order(self):
+        executor = BatchExecutor(FakeBitrix(as_list=True), 10, 4)
+        result = await executor.run({i: 'cmd' for i in range(25)})
+        assert result == [f'result_{i}' for i in range(25)]
+
+    @pytest.mark.asyncio
+    async def test_empty(self):
+        executor = BatchExecutor(FakeBitrix(), 10, 4)
+        assert await executor.run({}) == {}
+
+    @pytest.mark.asyncio
+    async def test_stream(self):
+        executor = BatchExecutor(FakeBitrix(), 10, 3)
+        parts = [part async for part in executor.stream({i: 'cmd' for i in range(25)})]
+        # Медленная первая порция приходит последней
+        assert list(parts[-1]) == list(range(10))
+        merged = {k: v for part in parts for k, v in part.items()}
+        assert merged == {i: f'result_{i}' for i in range(25)}
+
+    @pytest.mark.asyncio
+    async def test_stream_close(self):
+        bitrix = FakeBitrix()
+        executor = BatchExecutor(bitrix, 10, 2)
+        stream = executor.stream({i: 'cmd' for i in range(100)})
+        await anext(stream)
+        await stream.aclose()
+        await asyncio.sleep(0.06)
+        # Новые порции после закрытия не отправляются
+        assert bitrix.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_retry_failed_only(self):
+        bitrix = FakeBitrix(errors={3: ['QUERY_LIMIT_EXCEEDED'], 5: ['NOT_FOUND'], 7: ['OPERATION_TIME_LIMIT'] * 5})
+        executor = BatchExecutor(bitrix, 10, 2, retries=2, backoff=0.001)
+        result = await executor.execute({i: 'crm.item.update?id=1' for i in range(10)})
+        assert list(result.successes) == [0, 1, 2, 3, 4, 6, 8, 9]
+        assert list(result.errors) == [5]
+        assert list(result.retryable) == [7]
+        assert not result.ok
+        # Повторяются только команды с временными ошибками
+        assert bitrix.sent == [list(range(10)), [3, 7], [7]]
+
+    @pytest.mark.asyncio
+    async def test_transport_error(self):
+        class BrokenBitrix:
+            calls = 0
+
+            async def call(self, method, params, raw=False):
+                BrokenBitrix.calls += 1
+                raise ConnectionError('boom')
+
+        executor = BatchExecutor(BrokenBitrix(), 10, 2, retries=1, backoff=0.001)
+        result = await executor.execute({'a': 'crm.item.list?x=1', 'b': 'crm.item.get?id=1'})
+        assert result.successes == {}
+        assert result.retryable['a']['error'] == 'TRANSPORT_ERROR'
+        assert BrokenBitrix.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_no_retry_of_add(self):
+        bitrix = FakeBitrix(errors={
+            'add': ['INTERNAL_SERVER_ERROR'],
+            'bp': ['TRANSPORT_ERROR'],
+            'limit': ['QUERY_LIMIT_EXCEEDED'],
+        })
+        executor = BatchExecutor(bitrix, 10, 2, retries=2, backoff=0.001)
+        cmd = {
+            'add': 'crm.item.add?entityTypeId=1',
+            'bp': 'bizproc.workflow.start?TEMPLATE_ID=57',
+            'limit': 'crm.item.add?entityTypeId=1',
+        }
+        result = await executor.execute(cmd)
+        # add мог выполниться на портале - не повторяем, отклоненный по лимиту - повторяем
+        assert list(result.errors) == ['add', 'bp']
+        assert list(result.successes) == ['limit']
+        assert bitrix.sent == [['add', 'bp', 'limit'], ['limit']]
+
+    @pytest.mark.asyncio
+    async def test_run_raises(self):
+        bitrix = FakeBitrix(errors={1: ['NOT_FOUND']})
+        executor = BatchExecutor(bitrix, 10, 2)
+        with pytest.raises(BatchError) as exc:
+            await executor.run({i: 'crm.item.update?id=1' for i in range(3)})
+        assert list(exc.value.errors) == [1]
+        assert list(exc.value.successes) == [0, 2]
+
+
+class TestBatchTemplate:
+
+    def test_same_as_builder(self):
+        from src.utils import BatchBuilder
+        fields = {'ufCrm5Intervals': ['1:2', '3:4'], 'ufCrm5Comment': 'Дата & время', 'nested': {'a': [1, {'b': 2}]}}
+        params = {'entityTypeId': 1036, 'id': 5, 'fields': fields}
+        command = BatchBuilder('crm.item.update', {'entityTypeId': 1036}).compile('id', 'fields')
+        assert command.build(id=5, fields=fields) == BatchBuilder('crm.item.update', params).build()
+        assert command.build(id=6, fields={}) == 'crm.item.update?&entityTypeId=1036&id=6'
+        assert 'fields[nested][a][1][b]=2' in command.build(fields=fields)
+
+
+class TestBusinessProcesses:
+
+    @pytest.mark.asyncio
+    async def test_batched_and_deduplicated(self, monkeypatch):
+        from src.core import BitrixClient, BatchResult
+        sent = []
+
+        async def execute_batch(cmd: dict) -> BatchResult:
+            sent.append(cmd)
+            result = BatchResult()
+            result.successes = {k: 'workflow' for k in cmd if k != 2}
+            result.errors = {2: {'error': 'ACCESS_DENIED'}}
+            return result
+
+        monkeypatch.setattr(BitrixClient, 'execute_batch', execute_batch)
+        result = await BitrixClient.run_business_processes(60, 1, 2, 1, 3)
+        assert len(sent) == 1
+        assert list(sent[0]) == [1, 2, 3]
+        assert sent[0][3].startswith('bizproc.workflow.start?&TEMPLATE_ID=60&DOCUMENT_ID[0]=crm')
+        assert list(result.successes) == [1, 3]
+        assert list(result.failed) == [2]
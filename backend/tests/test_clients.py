@@ -0,0 +1,86 @@
+import pytest
+
+from src.core import BitrixClient
+from src.services.clients import ContactDirectory
+
+
+RAW_CLIENTS = [
+    {'ID': '1', 'NAME': 'Алёна', 'LAST_NAME': 'Иванова', 'DATE_MODIFY': '2025-07-01T10:00:00+03:00'},
+    {'ID': '2', 'NAME': 'Иван', 'LAST_NAME': 'Петров', 'DATE_MODIFY': '2025-07-02T10:00:00+03:00'},
+    {'ID': '3', 'NAME': 'Алексей', 'LAST_NAME': None, 'DATE_MODIFY': '2025-07-03T10:00:00+03:00'},
+]
+
+
+@pytest.fixture
+def directory(monkeypatch) -> ContactDirectory:
+    async def get_all_clients(since=None):
+        return [c for c in RAW_CLIENTS if since is None or c['DATE_MODIFY'] >= since]
+    monkeypatch.setattr(BitrixClient, 'get_all_clients', get_all_clients)
+    return ContactDirectory(ttl=60)
+
+
+class TestContactDirectory:
+
+    @pytest.mark.asyncio
+    async def test_get(self, directory: ContactDirectory):
+        client = await directory.get(2)
+        assert client.full_name == 'Иван Петров'
+        assert directory.watermark == '2025-07-03T10:00:00+03:00'
+
+    @pytest.mark.asyncio
+    async def test_search(self, directory: ContactDirectory):
+        items, total = await directory.search('ив')
+        assert total == 2 and [c.id for c in items] == [1, 2]
+        items, total = await directory.search('але ив')
+        assert total == 1 and items[0].id == 1
+        items, total = await directory.search('', offset=1, limit=1)
+        assert total == 3 and len(items) == 1
+
+    @pytest.mark.asyncio
+    async def test_full_reload(self, monkeypatch):
+        clients = list(RAW_CLIENTS)
+        async def get_all_clients(since=None):
+            return [c for c in clients if since is None or c['DATE_MODIFY'] >= since]
+        monkeypatch.setattr(BitrixClient, 'get_all_clients', get_all_clients)
+        directory = ContactDirectory(ttl=60, full_ttl=-1)
+        await directory.refresh()
+        clients.pop(0)
+        await directory.refresh()
+        assert 1 not in directory.by_id and [c.id for c in directory.sorted] == [3, 2]
+        items, total = await directory.search('але')
+        assert total == 1 and items[0].id == 3
+
+    @pytest.mark.asyncio
+    async def test_get_miss(self, monkeypatch):
+        calls = []
+        async def get_all_clients(since=None):
+            calls.append(since)
+            return RAW_CLIENTS
+        monkeypatch.setattr(BitrixClient, 'get_all_clients', get_all_clients)
+        directory = ContactDirectory(ttl=60, miss_interval=60)
+        assert await directory.get(99) is None
+        assert await directory.get(98) is None
+        assert len(calls) == 1
+        directory.loaded_at -= 61
+        assert await directory.get(99) is None
+        assert len(calls) == 2
+
+
+class TestSpecialistDirectory:
+
+    @pytest.mark.asyncio
+    async def test_version_only_on_change(self, monkeypatch):
+        from src.services.specialists import SpecialistDirectory
+        raw = [{'ID': 12, 'NAME': 'Анна', 'LAST_NAME': 'Иванова', 'UF_DEPARTMENT': []}]
+
+        async def get_specialists_by_department(departments):
+            return raw
+        monkeypatch.setattr(BitrixClient, 'get_specialists_by_department', get_specialists_by_department)
+        directory = SpecialistDirectory(ttl=60)
+        await directory.refresh()
+        await directory.refresh()
+        # Повторная загрузка тех же данных не меняет версию, а значит и ETag
+        assert directory.version == 1
+        raw = [{**raw[0], 'LAST_NAME': 'Петрова'}]
+        await directory.refresh()
+        assert directory.version == 2
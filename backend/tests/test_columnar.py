@@ -0,0 +1,71 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import src.api.main as api_main
+from src.core import BXConstants
+from src.schemas.api import BXAppointment
+from src.services import MIRROR
+from src.utils import COLUMNAR_MEDIA_TYPE, to_columns
+
+
+def appointment(id: int, code: str, status: int | None) -> dict:
+    return {
+        'id': id,
+        'assignedById': 12,
+        'ufCrm3Children': 30,
+        'ufCrm3StartDate': '2025-07-07T10:00:00+03:00',
+        'ufCrm3EndDate': '2025-07-07T10:30:00+03:00',
+        'ufCrm3Code': [code],
+        'ufCrm3Status': status,
+        BXConstants.appointment.uf.abonnement: None,
+        'updatedTime': 'x',
+    }
+
+
+@pytest.fixture(autouse=True)
+def lists(monkeypatch):
+    monkeypatch.setitem(BXConstants.appointment.lfv.codeById, '52', 'L')
+    monkeypatch.setitem(BXConstants.appointment.lfv.codeById, '53', 'S')
+    monkeypatch.setitem(BXConstants.appointment.lfv.statusById, 60, 'done')
+
+
+class TestColumnar:
+
+    def test_to_columns(self):
+        items = [
+            BXAppointment.model_validate(appointment(1, '52', 60)),
+            BXAppointment.model_validate(appointment(2, '53', None)),
+            BXAppointment.model_validate(appointment(3, '52', None)),
+        ]
+        items[1].old_code = 'L'
+        result = to_columns(items, api_main.APPOINTMENT_DICTIONARIES, api_main.APPOINTMENT_SAME_AS)
+        assert result['count'] == 3
+        assert result['columns']['id'] == [1, 2, 3]
+        assert result['dictionaries'] == {'code': ['L', 'S'], 'status': ['done']}
+        assert result['columns']['code'] == [0, 1, 0]
+        assert result['columns']['old_code'] == [None, 0, None]
+        assert result['columns']['status'] == [0, None, None]
+        assert result['columns']['old_specialist'] == [None, None, None]
+        assert to_columns([], api_main.APPOINTMENT_DICTIONARIES)['columns'] == {}
+
+    def test_negotiation(self, monkeypatch):
+        async def get_appointments(start, end, spec_ids=None):
+            return [appointment(1, '52', 60), appointment(2, '53', None)]
+
+        async def fill_previous(*appointments):
+            pass
+
+        monkeypatch.setattr(MIRROR, 'ready', False)
+        monkeypatch.setattr(MIRROR, 'get_appointments', get_appointments)
+        monkeypatch.setattr(api_main, 'fill_previous', fill_previous)
+        app = FastAPI()
+        app.include_router(api_main.router)
+        client = TestClient(app)
+        params = {'start': '2025-07-06T00:00:00+03:00', 'end': '2025-07-08T00:00:00+03:00'}
+        plain = client.get('/get_schedules', params=params)
+        columnar = client.get('/get_schedules', params=params, headers={'Accept': COLUMNAR_MEDIA_TYPE})
+        assert columnar.headers['content-type'] == COLUMNAR_MEDIA_TYPE
+        assert columnar.headers['ETag'] != plain.headers['ETag']
+        assert 'X-Changes-Cursor' in columnar.headers
+        assert columnar.json()['columns']['id'] == [a['id'] for a in plain.json()]
@@ -0,0 +1,53 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.api.main import router
+from src.services import MIRROR
+
+
+@pytest.fixture
+def client(monkeypatch) -> tuple[TestClient, list]:
+    calls = []
+
+    async def get_schedules(start, end, spec_ids=None):
+        calls.append((start, end))
+        return [{'id': 7, 'assignedById': 12, 'ufCrm4Date': '2025-07-07T00:00:00+03:00', 'updatedTime': 'x'}]
+    monkeypatch.setattr(MIRROR, 'get_schedules', get_schedules)
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app), calls
+
+
+class TestETag:
+
+    def test_warm_mirror(self, client, monkeypatch):
+        test_client, calls = client
+        monkeypatch.setattr(MIRROR, 'ready', True)
+        params = {'start': '2025-07-06T00:00:00+03:00', 'end': '2025-07-08T00:00:00+03:00'}
+        first = test_client.get('/get_work_schedules', params=params)
+        etag = first.headers['ETag']
+        second = test_client.get('/get_work_schedules', params=params, headers={'If-None-Match': etag})
+        assert second.status_code == 304
+        # Зеркало не читалось для ответа 304
+        assert len(calls) == 1
+        monkeypatch.setitem(MIRROR.versions, MIRROR.schedules.entityTypeId, MIRROR.versions[MIRROR.schedules.entityTypeId] + 1)
+        third = test_client.get('/get_work_schedules', params=params, headers={'If-None-Match': etag})
+        assert third.status_code == 200
+        assert third.headers['ETag'] != etag
+
+    def test_cold_mirror(self, client, monkeypatch):
+        test_client, calls = client
+        monkeypatch.setattr(MIRROR, 'ready', False)
+        params = {'start': '2025-07-06T00:00:00+03:00', 'end': '2025-07-08T00:00:00+03:00'}
+        etag = test_client.get('/get_work_schedules', params=params).headers['ETag']
+        response = test_client.get('/get_work_schedules', params=params, headers={'If-None-Match': f'"other", {etag}'})
+        assert response.status_code == 304
+        assert len(calls) == 2
+
+    def test_boot_id(self, monkeypatch):
+        import src.utils.funcs as funcs
+        etag = funcs.make_etag('specialists', 1)
+        monkeypatch.setattr(funcs, 'BOOT_ID', 'restarted')
+        # После перезапуска та же версия дает другой тег
+        assert funcs.make_etag('specialists', 1) != etag
@@ -0,0 +1,95 @@
+import pytest
+import json
+
+from src.core import BXConstants, Settings
+from src.events.emitter import LocalEventEmitter
+from src.services import MIRROR
+
+
+@pytest.fixture(scope='class', autouse=True)
+def token():
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(Settings, 'BITRIX_EVENTS_TOKEN', 'test-token')
+        yield
+
+
+@pytest.fixture(scope='class')
+def emitter(test_client) -> LocalEventEmitter:
+    return LocalEventEmitter(test_client)
+
+
+@pytest.fixture(scope='class')
+def test_appointment(test_client) -> dict:
+    data = {
+        'specialist': 12,
+        'code': 'L',
+        'patient': 17,
+        'start': "2025-07-07T10:00:00+03:00",
+        'end': "2025-07-07T10:30:00+03:00",
+    }
+    response = test_client.post('/front/appointment/', content=json.dumps(data))
+    yield response.json()
+    test_client.delete(f'/front/appointment/{response.json()['id']}')
+
+
+class TestEvents:
+
+    def test_wrong_event(self, test_client):
+        response = test_client.post('/events/', content='event=ONCRMDEALUPDATE&auth[application_token]=test-token')
+        assert response.status_code == 400
+
+    def test_wrong_token(self, test_client, monkeypatch):
+        response = test_client.post('/events/', content='event=ONCRMDYNAMICITEMUPDATE&auth[application_token]=x')
+        assert response.status_code == 403
+        monkeypatch.setattr(Settings, 'BITRIX_EVENTS_TOKEN', None)
+        response = test_client.post('/events/', content='event=ONCRMDYNAMICITEMUPDATE&auth[application_token]=')
+        assert response.status_code == 403
+
+    def test_other_entity(self, emitter):
+        response = emitter.emit('update', 2, 1)
+        assert response.status_code == 200
+        assert response.json() == {'applied': False}
+
+    @pytest.mark.asyncio
+    async def test_update_and_delete(self, emitter, test_appointment):
+        aety = BXConstants.appointment.entityTypeId
+        start, end = "2025-07-07T00:00:00+03:00", "2025-07-08T00:00:00+03:00"
+        await MIRROR.delete(aety, test_appointment['id'])
+        response = emitter.emit('update', aety, test_appointment['id'])
+        assert response.json() == {'applied': True}
+        assert test_appointment['id'] in await MIRROR.get_versions(aety, start, end)
+        emitter.emit('delete', aety, test_appointment['id'])
+        assert test_appointment['id'] not in await MIRROR.get_versions(aety, start, end)
+
+
+class TestReconcileEndpoint:
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from src.events import routing
+        runs = []
+
+        class Reconciler:
+            def __init__(self, start, end):
+                self.period = (start, end)
+
+            async def run(self):
+                runs.append(self.period)
+                return {'upserted': 0, 'deleted': 0}
+
+        monkeypatch.setattr(routing, 'Reconciler', Reconciler)
+        app = FastAPI()
+        app.include_router(routing.router)
+        return TestClient(app), runs
+
+    def test_token_and_period(self, client):
+        test_client, runs = client
+        params = {'start': '2025-07-01T00:00:00+03:00', 'end': '2025-07-15T00:00:00+03:00'}
+        assert test_client.post('/events/reconcile', params=params).status_code == 403
+        headers = {'X-Application-Token': 'test-token'}
+        assert test_client.post('/events/reconcile', params=params, headers=headers).status_code == 200
+        too_long = {**params, 'end': '2025-12-01T00:00:00+03:00'}
+        assert test_client.post('/events/reconcile', params=too_long, headers=headers).status_code == 422
+        assert len(runs) == 1
@@ -0,0 +1,49 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.api.main import router
+from src.schemas.api import BXSpecialist
+from src.services import MIRROR, SPECIALISTS
+
+
+@pytest.fixture
+def client(monkeypatch) -> tuple[TestClient, list]:
+    calls = []
+    specialists = [
+        BXSpecialist.model_validate({'ID': 12, 'NAME': 'Анна', 'LAST_NAME': 'Иванова', 'UF_DEPARTMENT': [59]}),
+        BXSpecialist.model_validate({'ID': 13, 'NAME': 'Олег', 'LAST_NAME': 'Петров', 'UF_DEPARTMENT': [59, 64]}),
+    ]
+
+    async def get_by_departments(codes):
+        return [s for s in specialists if set(s.departments) & set(codes)]
+
+    async def get_schedules(start, end, spec_ids=None):
+        calls.append(spec_ids)
+        return []
+    monkeypatch.setattr(SPECIALISTS, 'get_by_departments', get_by_departments)
+    monkeypatch.setattr(MIRROR, 'get_schedules', get_schedules)
+    monkeypatch.setattr(MIRROR, 'ready', False)
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app), calls
+
+
+class TestSpecialistFilter:
+
+    def test_resolve(self, client):
+        test_client, calls = client
+        params = {'start': '2025-07-06T00:00:00+03:00', 'end': '2025-07-08T00:00:00+03:00'}
+        test_client.get('/get_work_schedules', params=params)
+        test_client.get('/get_work_schedules', params={**params, 'specialist_ids': [13, 12, 13]})
+        # Подразделение можно передать кодом или id
+        test_client.get('/get_work_schedules', params={**params, 'department': 'АБА'})
+        test_client.get('/get_work_schedules', params={**params, 'department': '64'})
+        test_client.get('/get_work_schedules', params={**params, 'department': 'Л', 'specialist_ids': 12})
+        assert calls == [None, [12, 13], [12, 13], [13], []]
+
+    def test_unknown_department(self, client):
+        test_client, calls = client
+        params = {'start': '2025-07-06T00:00:00+03:00', 'end': '2025-07-08T00:00:00+03:00', 'department': 'XYZ'}
+        assert test_client.get('/get_work_schedules', params=params).status_code == 400
+        assert calls == []
@@ -0,0 +1,91 @@
+from datetime import datetime, time, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import src.api.main as api_main
+from src.core import BXConstants, Settings
+from src.schemas.api import BXSpecialist
+from src.services import MIRROR, SPECIALISTS
+from src.appointplan.handler.free_time import FreeTimeIndex
+
+
+def moscow(day: int, hour: int, minute: int = 0) -> datetime:
+    return datetime(2025, 7, day, hour, minute, tzinfo=Settings.TIMEZONE)
+
+
+def schedule(id: int, specialist: int, day: int, start: int, end: int) -> dict:
+    interval = f'{int(moscow(day, start).timestamp() * 1000)}:{int(moscow(day, end).timestamp() * 1000)}'
+    return {'id': id, 'assignedById': specialist, 'ufCrm4Date': moscow(day, 0).isoformat(), 'ufCrm4Intervals': [interval]}
+
+
+def appointment(id: int, specialist: int, start: datetime, end: datetime) -> dict:
+    return {
+        'id': id,
+        'assignedById': specialist,
+        'ufCrm3Children': 30,
+        'ufCrm3StartDate': start.isoformat(),
+        'ufCrm3EndDate': end.isoformat(),
+        'ufCrm3Code': ['52'],
+    }
+
+
+@pytest.fixture
+def calls(monkeypatch) -> list:
+    calls = []
+
+    async def get_schedules(start, end, spec_ids=None):
+        calls.append(sorted(spec_ids))
+        return [schedule(1, 12, 7, 9, 12), schedule(2, 13, 7, 10, 12), schedule(3, 12, 8, 9, 10)]
+
+    async def get_appointments(start, end, spec_ids=None):
+        return [appointment(5, 12, moscow(7, 9), moscow(7, 10))]
+
+    monkeypatch.setitem(BXConstants.appointment.lfv.codeById, '52', 'L')
+    monkeypatch.setattr(MIRROR, 'get_schedules', get_schedules)
+    monkeypatch.setattr(MIRROR, 'get_appointments', get_appointments)
+    return calls
+
+
+def specialist(id: int) -> BXSpecialist:
+    return BXSpecialist.model_validate({'ID': id, 'NAME': 'Анна', 'LAST_NAME': 'Иванова', 'UF_DEPARTMENT': []})
+
+
+class TestFreeTimeIndex:
+
+    @pytest.mark.asyncio
+    async def test_find(self, calls):
+        index = FreeTimeIndex(60)
+        specialists = [specialist(12), specialist(13)]
+        slots = await index.find(specialists, moscow(7, 0), moscow(9, 0), timedelta(hours=1))
+        # Занятие 9:00-10:00 вычтено из графика специалиста 12
+        assert [(id, i.start.hour) for id, i in slots] == [(12, 10), (13, 10), (12, 11), (13, 11), (12, 9)]
+        slots = await index.find(specialists, moscow(7, 0), moscow(9, 0), timedelta(hours=1), time_from=time(11), limit=1)
+        assert [(id, i.start.hour) for id, i in slots] == [(12, 11)]
+        # Повторный поиск из кэша
+        assert calls == [[12, 13]]
+        assert index.stats()['hits'] == 2
+
+    @pytest.mark.asyncio
+    async def test_invalidate(self, calls):
+        index = FreeTimeIndex(60)
+        await index.find([specialist(12), specialist(13)], moscow(7, 0), moscow(8, 0), timedelta(hours=1))
+        index.invalidate([{'positions': [(13, 0, 0)]}])
+        await index.find([specialist(12), specialist(13)], moscow(7, 0), moscow(8, 0), timedelta(hours=1))
+        assert calls == [[12, 13], [13]]
+
+    def test_endpoint_unencoded_offset(self, calls, monkeypatch):
+        async def all_specialists():
+            return [specialist(12), specialist(13)]
+        monkeypatch.setattr(SPECIALISTS, 'all', all_specialists)
+        monkeypatch.setattr(api_main, 'FREE_TIME', FreeTimeIndex(60))
+        app = FastAPI()
+        app.include_router(api_main.router)
+        # '+' смещения без кодирования приходит пробелом
+        response = TestClient(app).get(
+            '/free_slots?start=2025-07-07T00:00:00+03:00&end=2025-07-08T00:00:00+03:00&duration=60&limit=1'
+        )
+        assert response.status_code == 200
+        slot = response.json()[0]
+        assert slot['specialist'] == 12 and slot['start'].startswith('2025-07-07T10:00:00')
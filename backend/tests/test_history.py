@@ -0,0 +1,174 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import src.api.appointment as api_appointment
+import src.services.history as services_history
+from src.core import BXConstants, BitrixClient
+from src.services import MIRROR, ABONNEMENT_CONTROL
+from src.services.history import AppointmentHistory
+
+
+@pytest.fixture
+def history(tmp_path) -> AppointmentHistory:
+    return AppointmentHistory(str(tmp_path / 'history.sqlite3'))
+
+
+def appointment(id: int, specialist: int, start: str, patient: int | None = 30) -> dict:
+    return {
+        'id': id,
+        'assignedById': specialist,
+        'ufCrm3Children': patient,
+        'ufCrm3StartDate': start,
+        'ufCrm3EndDate': start,
+        'ufCrm3Code': [],
+        'ufCrm3Status': None,
+        BXConstants.appointment.uf.abonnement: None,
+    }
+
+
+class TestAppointmentHistory:
+
+    @pytest.mark.asyncio
+    async def test_latest(self, history: AppointmentHistory):
+        await history.record(appointment(1, 12, '2025-07-07T10:00:00+03:00'))
+        await history.record(appointment(1, 13, '2025-07-08T10:00:00+03:00'), appointment(2, 14, '2025-07-09T10:00:00+03:00'))
+        entries = await history.latest(1, 5)
+        assert [e['specialist'] for _, e in entries] == [13, 12]
+        assert entries[0][1]['patient'] == 30
+        assert await history.latest(3) == []
+
+    @pytest.mark.asyncio
+    async def test_revert(self, history: AppointmentHistory):
+        for specialist in (11, 12, 13):
+            await history.record(appointment(1, specialist, '2025-07-07T10:00:00+03:00'))
+        entries = await history.latest(1, 2)
+        await history.revert(1, *(seq for seq, _ in entries))
+        # Откат на 2 шага: остается только самая старая запись
+        assert [e['specialist'] for _, e in await history.latest(1, 5)] == [11]
+
+
+class TestCommentHistory:
+
+    @pytest.mark.asyncio
+    async def test_get_many(self, monkeypatch):
+        from src.services.history import CommentHistory
+        requests = []
+
+        async def get_history_comments(ids):
+            requests.append(list(ids))
+            # Фильтр битры по тексту мог не сработать: обычный коммент новее коммента history;
+            return [
+                {'ID': '40', 'ENTITY_ID': '1', 'COMMENT': 'Перенесли по просьбе мамы'},
+                {'ID': '30', 'ENTITY_ID': '1', 'COMMENT': 'history;user_15;30;28.07.2025 09:00:00;28.07.2025 10:00:00;L;;197;'},
+                {'ID': '20', 'ENTITY_ID': '1', 'COMMENT': 'history;user_16;30;27.07.2025 09:00:00;27.07.2025 10:00:00;R;;197;'},
+                {'ID': '10', 'ENTITY_ID': '2', 'COMMENT': 'history;broken'},
+            ]
+        monkeypatch.setattr(BitrixClient, 'get_history_comments', get_history_comments)
+        comments = CommentHistory(ttl=60, max_size=100)
+        result = await comments.get_many([1, 2, 3])
+        assert result[1]['specialist'] == 15
+        assert result[1]['code'] == 'L'
+        assert result[1]['status'] is None
+        assert result[2] is None and result[3] is None
+        await comments.get_many([1, 3])
+        assert requests == [[1, 2, 3]]
+        comments.invalidate(1)
+        await comments.get_many([1, 3])
+        assert requests == [[1, 2, 3], [1]]
+
+    @pytest.mark.asyncio
+    async def test_eviction(self, monkeypatch):
+        from src.services.history import CommentHistory
+
+        async def get_history_comments(ids):
+            return []
+        monkeypatch.setattr(BitrixClient, 'get_history_comments', get_history_comments)
+        comments = CommentHistory(ttl=60, max_size=2)
+        assert await comments.get_many([1, 2, 3]) == {1: None, 2: None, 3: None}
+        # Сверх max_size убираются самые старые
+        assert list(comments._cache) == [2, 3]
+        comments.ttl = -1
+        await comments.get_many([4])
+        assert list(comments._cache) == []
+
+
+@pytest.fixture
+def rollback(monkeypatch, history: AppointmentHistory) -> dict:
+    """Битра и зеркало заменены заглушками, в state - комменты history; и что было обновлено/удалено"""
+    uf = BXConstants.appointment.uf
+    state = {'comments': [], 'updated': [], 'deleted': []}
+
+    async def get_crm_item(aety, id):
+        return appointment(id, 11, '2025-07-07T10:00:00+03:00')
+
+    async def update_crm_item(aety, id, fields):
+        state['updated'].append(fields)
+        return appointment(id, fields[uf.specialist], fields[uf.start])
+
+    async def get_comments_list(id):
+        return state['comments']
+
+    async def delete_comment(comment):
+        state['deleted'].append(comment['ID'])
+
+    async def get_history_comments(ids):
+        return []
+
+    async def save_appointments(*items):
+        pass
+
+    for name, fake in [
+        ('get_crm_item', get_crm_item), ('update_crm_item', update_crm_item),
+        ('get_comments_list', get_comments_list), ('delete_comment', delete_comment),
+        ('get_history_comments', get_history_comments),
+    ]:
+        monkeypatch.setattr(BitrixClient, name, fake)
+    monkeypatch.setattr(MIRROR, 'save_appointments', save_appointments)
+    monkeypatch.setattr(ABONNEMENT_CONTROL, 'schedule', lambda *ids: None)
+    monkeypatch.setattr(api_appointment, 'HISTORY', history)
+    monkeypatch.setattr(services_history, 'HISTORY', history)
+    app = FastAPI()
+    app.include_router(api_appointment.router)
+    state['client'] = TestClient(app)
+    return state
+
+
+class TestRollback:
+
+    @pytest.mark.asyncio
+    async def test_update_records_bitrix_state(self, rollback: dict, history: AppointmentHistory):
+        body = {
+            'specialist': 15, 'patient': 30, 'code': 'L',
+            'start': '2025-07-08T10:00:00+03:00', 'end': '2025-07-08T11:00:00+03:00',
+        }
+        response = rollback['client'].put('/appointment/1', json=body)
+        assert response.status_code == 200
+        # В историю попадает состояние из битры, а не из зеркала
+        assert [e['specialist'] for _, e in await history.latest(1)] == [11]
+
+    @pytest.mark.asyncio
+    async def test_local_and_comments(self, rollback: dict, history: AppointmentHistory):
+        rollback['comments'] = [
+            {'ID': '20', 'ENTITY_ID': 1, 'COMMENT': 'history;user_15;30;28.07.2025 09:00:00;28.07.2025 10:00:00;L;;197;'},
+        ]
+        await history.record(appointment(1, 12, '2025-07-07T10:00:00+03:00'))
+        response = rollback['client'].put('/appointment/rollback/1', params={'steps': 2})
+        assert response.status_code == 200
+        assert response.json()['specialist'] == 15
+        assert rollback['deleted'] == ['20']
+        assert await history.latest(1) == []
+
+    @pytest.mark.asyncio
+    async def test_too_many_steps(self, rollback: dict, history: AppointmentHistory):
+        await history.record(appointment(1, 12, '2025-07-07T10:00:00+03:00'))
+        response = rollback['client'].put('/appointment/rollback/1', params={'steps': 2})
+        assert response.status_code == 409
+        assert rollback['updated'] == [] and len(await history.latest(1)) == 1
+
+    @pytest.mark.asyncio
+    async def test_incomplete_entry(self, rollback: dict, history: AppointmentHistory):
+        await history.record(appointment(1, 12, '2025-07-07T10:00:00+03:00', patient=None))
+        response = rollback['client'].put('/appointment/rollback/1')
+        assert response.status_code == 409
+        assert rollback['updated'] == []
@@ -0,0 +1,47 @@
+import asyncio
+import pytest
+
+from src.core.loader import BatchLoader, BitrixCommandError
+
+
+class FakeBitrix:
+    """Имитирует batch метод битры, вызванный с raw=True"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def call(self, method: str, params: dict, raw: bool = False):
+        self.calls.append(params['cmd'])
+        result, errors = {}, {}
+        for key, command in params['cmd'].items():
+            if 'id=0' in command:
+                errors[key] = {'error': 'NOT_FOUND', 'error_description': 'Not found'}
+            else:
+                result[key] = command
+        return {'result': {'result': result, 'result_error': errors}}
+
+
+class TestBatchLoader:
+
+    @pytest.mark.asyncio
+    async def test_one_batch_per_tick(self):
+        bitrix = FakeBitrix()
+        loader = BatchLoader(bitrix, 50)
+        first, second = await asyncio.gather(
+            loader.load('crm.item.get', {'entityTypeId': 1036, 'id': 1}),
+            loader.load('crm.deal.get', {'id': 2}),
+        )
+        assert first == 'crm.item.get?&entityTypeId=1036&id=1'
+        assert second == 'crm.deal.get?&id=2'
+        assert len(bitrix.calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_command_error(self):
+        loader = BatchLoader(FakeBitrix(), 50)
+        results = await asyncio.gather(
+            loader.load('crm.item.get', {'id': 0}),
+            loader.load('crm.item.get', {'id': 3}),
+            return_exceptions=True
+        )
+        assert isinstance(results[0], BitrixCommandError) and results[0].error == 'NOT_FOUND'
+        assert results[1] == 'crm.item.get?&id=3'
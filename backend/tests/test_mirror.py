@@ -0,0 +1,130 @@
+import pytest
+
+from src.services.mirror import Mirror, BROKER
+from src.services.broker import ChangeBroker
+
+
+@pytest.fixture
+def mirror(tmp_path) -> Mirror:
+    mirror = Mirror(str(tmp_path / 'mirror.sqlite3'))
+    mirror.ready = True
+    return mirror
+
+
+def appointment(id: int, specialist: int, start: str, end: str) -> dict:
+    return {
+        'id': id,
+        'assignedById': specialist,
+        'ufCrm3StartDate': start,
+        'ufCrm3EndDate': end,
+        'updatedTime': '2025-07-01T10:00:00+03:00'
+    }
+
+
+def seq(cursor: str) -> int:
+    return int(cursor.rpartition('-')[2])
+
+
+class TestMirror:
+
+    @pytest.mark.asyncio
+    async def test_range_and_specialist(self, mirror: Mirror):
+        await mirror.save_appointments(
+            appointment(1, 12, '2025-07-07T10:00:00+03:00', '2025-07-07T10:30:00+03:00'),
+            appointment(2, 13, '2025-07-08T10:00:00+03:00', '2025-07-08T10:30:00+03:00'),
+            appointment(3, 12, '2025-08-01T10:00:00+03:00', '2025-08-01T10:30:00+03:00'),
+        )
+        week = await mirror.get_appointments('2025-07-06T21:00:00.000Z', '2025-07-13T21:00:00.000Z')
+        assert [a['id'] for a in week] == [1, 2]
+        week = await mirror.get_appointments('2025-07-06T21:00:00.000Z', '2025-07-13T21:00:00.000Z', (12, ))
+        assert [a['id'] for a in week] == [1]
+
+    @pytest.mark.asyncio
+    async def test_write_through(self, mirror: Mirror):
+        await mirror.save_schedules({'id': 7, 'assignedById': 12, 'ufCrm4Date': '2025-07-07T00:00:00+03:00'})
+        schedules = await mirror.get_schedules('2025-07-06T00:00:00+03:00', '2025-07-08T00:00:00+03:00')
+        assert [s['id'] for s in schedules] == [7]
+        await mirror.delete_schedules(7)
+        assert await mirror.get_schedules('2025-07-06T00:00:00+03:00', '2025-07-08T00:00:00+03:00') == []
+
+    @pytest.mark.asyncio
+    async def test_version(self, mirror: Mirror):
+        aety = mirror.appointments.entityTypeId
+        item = appointment(1, 12, '2025-07-07T10:00:00+03:00', '2025-07-07T10:30:00+03:00')
+        await mirror.save_appointments(item)
+        version = mirror.versions[aety]
+        # Повторная синхронизация того же элемента версию не меняет
+        await mirror.save_appointments(item)
+        assert mirror.versions[aety] == version
+        await mirror.save_appointments({**item, 'updatedTime': '2025-07-02T10:00:00+03:00'})
+        assert mirror.versions[aety] == version + 1
+        await mirror.delete_appointments(1)
+        assert mirror.versions[aety] == version + 2
+
+    @pytest.mark.asyncio
+    async def test_changes(self, mirror: Mirror):
+        aety = mirror.appointments.entityTypeId
+        start, end = '2025-07-06T21:00:00.000Z', '2025-07-13T21:00:00.000Z'
+        await mirror.save_appointments(
+            appointment(1, 12, '2025-07-07T10:00:00+03:00', '2025-07-07T10:30:00+03:00'),
+            appointment(2, 12, '2025-07-08T10:00:00+03:00', '2025-07-08T10:30:00+03:00'),
+        )
+        cursor = await mirror.get_cursor()
+        moved = {**appointment(2, 12, '2025-08-08T10:00:00+03:00', '2025-08-08T10:30:00+03:00'), 'updatedTime': 'new'}
+        await mirror.save_appointments(
+            appointment(3, 13, '2025-07-09T10:00:00+03:00', '2025-07-09T10:30:00+03:00'),
+            moved
+        )
+        await mirror.delete_appointments(1)
+        new_cursor, items, deleted = await mirror.get_changes(cursor, start, end)
+        assert seq(new_cursor) == seq(cursor) + 3
+        assert [i['id'] for i in items[aety]] == [3]
+        # 1 удален, 2 ушел из периода
+        assert deleted[aety] == [1, 2]
+        _, items, deleted = await mirror.get_changes(new_cursor, start, end)
+        assert items[aety] == [] and deleted[aety] == []
+        mirror._prune_changes(float('inf'))
+        assert await mirror.get_changes(cursor, start, end) is None
+        assert (await mirror.get_changes(new_cursor, start, end))[0] == new_cursor
+        # Курсор из будущего или от другой базы
+        assert await mirror.get_changes(f'{mirror.epoch}-{seq(new_cursor) + 1}', start, end) is None
+        assert await mirror.get_changes(f'other-{seq(new_cursor)}', start, end) is None
+        assert await mirror.get_changes('broken', start, end) is None
+
+    @pytest.mark.asyncio
+    async def test_epoch(self, tmp_path):
+        path = str(tmp_path / 'mirror.sqlite3')
+        epoch = Mirror(path).epoch
+        # Та же база - тот же id, новая база - новый
+        assert Mirror(path).epoch == epoch
+        assert Mirror(str(tmp_path / 'other.sqlite3')).epoch != epoch
+
+    @pytest.mark.asyncio
+    async def test_subscribe(self, mirror: Mirror):
+        subscription = mirror.subscribe('2025-07-06T21:00:00.000Z', '2025-07-13T21:00:00.000Z', [12])
+        try:
+            await mirror.save_appointments(
+                appointment(1, 12, '2025-07-07T10:00:00+03:00', '2025-07-07T10:30:00+03:00'),
+                appointment(2, 13, '2025-07-08T10:00:00+03:00', '2025-07-08T10:30:00+03:00'),
+                appointment(3, 12, '2025-08-01T10:00:00+03:00', '2025-08-01T10:30:00+03:00'),
+            )
+            # Ушел из периода - событие приходит по прежнему положению
+            moved = {**appointment(1, 12, '2025-08-07T10:00:00+03:00', '2025-08-07T10:30:00+03:00'), 'updatedTime': 'new'}
+            await mirror.save_appointments(moved)
+            await mirror.delete_appointments(2, 3)
+            messages = []
+            while not subscription.queue.empty():
+                messages.append(subscription.queue.get_nowait())
+            assert [(m['id'], m['action']) for m in messages] == [(1, 'upsert'), (1, 'upsert')]
+            assert seq(messages[-1]['cursor']) == seq(await mirror.get_cursor()) - 2
+        finally:
+            BROKER.unsubscribe(subscription)
+
+    def test_broker_overflow(self):
+        broker = ChangeBroker(1)
+        subscription = broker.subscribe(0, 100)
+        event = {'cursor': 1, 'entity': 'appointments', 'id': 1, 'action': 'upsert', 'positions': [(12, 10, 20)]}
+        broker.publish([event, {**event, 'cursor': 2}])
+        assert subscription.overflow and subscription.queue.qsize() == 1
+        broker.unsubscribe(subscription)
+        assert broker.stats()['subscribers'] == 0
@@ -0,0 +1,34 @@
+import asyncio
+import pytest
+
+from src.core.scheduler import RequestScheduler, Lane, CURRENT_LANE, get_lane
+
+
+class TestRequestScheduler:
+
+    def test_lanes(self):
+        assert get_lane('crm.item.list', {}) == Lane.INTERACTIVE
+        assert get_lane('crm.item.update', {}) == Lane.WRITE
+        batch = {'cmd': {'0': 'bizproc.workflow.start?&TEMPLATE_ID=57'}}
+        assert get_lane('batch', batch) == Lane.BACKGROUND
+        token = CURRENT_LANE.set(Lane.BACKGROUND)
+        assert get_lane('crm.item.list', {}) == Lane.BACKGROUND
+        CURRENT_LANE.reset(token)
+
+    @pytest.mark.asyncio
+    async def test_priority(self):
+        scheduler = RequestScheduler(rate=100, capacity=1)
+        order = []
+
+        async def request(lane: str):
+            await scheduler.acquire(lane)
+            order.append(lane)
+
+        await scheduler.acquire(Lane.WRITE)         # Бакет пуст, дальше все ждут
+        await asyncio.gather(
+            request(Lane.BACKGROUND), request(Lane.WRITE), request(Lane.INTERACTIVE)
+        )
+        assert order == [Lane.INTERACTIVE, Lane.WRITE, Lane.BACKGROUND]
+        stats = scheduler.stats()
+        assert stats[Lane.BACKGROUND]['requests'] == 1
+        assert stats[Lane.BACKGROUND]['wait_max'] > 0
@@ -0,0 +1,40 @@
+import pytest
+
+from src.core import bitrix, BitrixClient
+
+
+class FakeBitrix:
+    """Имитирует get_all, отдавая по одному элементу на каждую часть периода"""
+
+    def __init__(self):
+        self.filters = []
+
+    async def get_all(self, method: str, params: dict):
+        self.filters.append(params['filter'])
+        # Элемент 0 попадает во все части, чтобы проверить удаление дублей
+        return [{'id': len(self.filters)}, {'id': 0}]
+
+
+class TestShardedList:
+
+    @pytest.mark.asyncio
+    async def test_shards(self, monkeypatch):
+        fake = FakeBitrix()
+        monkeypatch.setattr(bitrix, 'BITRIX', fake)
+        params = {'entityTypeId': 1036, 'filter': {'>=start': 'x', '<=end': 'y'}}
+        items = await BitrixClient.get_list_sharded(
+            params, 'start', '2025-01-01T00:00:00+03:00', '2025-04-01T00:00:00+03:00'
+        )
+        assert len(fake.filters) == 3
+        assert [i['id'] for i in items] == [0, 1, 2, 3]
+        assert fake.filters[0]['>=start'] == '2025-01-01T00:00:00+03:00'
+        assert fake.filters[0]['<start'] == fake.filters[1]['>=start']
+        assert '<start' not in fake.filters[-1] and fake.filters[-1]['<=end'] == 'y'
+
+    @pytest.mark.asyncio
+    async def test_small_period(self, monkeypatch):
+        fake = FakeBitrix()
+        monkeypatch.setattr(bitrix, 'BITRIX', fake)
+        params = {'entityTypeId': 1036, 'filter': {}}
+        await BitrixClient.get_list_sharded(params, 'start', '2025-01-01', '2025-01-08')
+        assert len(fake.filters) == 1
@@ -0,0 +1,38 @@
+import asyncio
+import pytest
+
+from src.utils import SingleFlight
+
+
+class TestSingleFlight:
+
+    @pytest.mark.asyncio
+    async def test_coalescing(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        @single_flight
+        async def read(start, spec_ids):
+            calls.append(start)
+            await asyncio.sleep(0.01)
+            return [start, *spec_ids]
+
+        results = await asyncio.gather(
+            read('a', [1, 2]), read('a', [1, 2]), read('a', [1, 2]), read('b', [1])
+        )
+        assert results == [['a', 1, 2], ['a', 1, 2], ['a', 1, 2], ['b', 1]]
+        assert calls == ['a', 'b']
+        stats = single_flight.stats()
+        assert stats['hits'] == 2 and stats['misses'] == 2 and stats['in_flight'] == 0
+
+    @pytest.mark.asyncio
+    async def test_error_fan_out(self):
+        single_flight = SingleFlight()
+
+        @single_flight
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError()
+
+        results = await asyncio.gather(fail(), fail(), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
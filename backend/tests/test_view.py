@@ -0,0 +1,92 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import src.api.main as api_main
+from src.core import BXConstants, BitrixClient
+from src.schemas.api import BXSpecialist, BXClient
+from src.services import MIRROR, SPECIALISTS, CLIENTS
+
+
+def appointment(id: int, specialist: int, start: str) -> dict:
+    return {
+        'id': id,
+        'assignedById': specialist,
+        'ufCrm3Children': 30,
+        'ufCrm3StartDate': start,
+        'ufCrm3EndDate': start,
+        'ufCrm3Code': ['52'],
+        'ufCrm3Status': None,
+        BXConstants.appointment.uf.abonnement: None,
+    }
+
+
+@pytest.fixture
+def client(monkeypatch) -> TestClient:
+    specialists = [
+        BXSpecialist.model_validate({'ID': 12, 'NAME': 'Анна', 'LAST_NAME': 'Иванова', 'UF_DEPARTMENT': []}),
+        BXSpecialist.model_validate({'ID': 13, 'NAME': 'Олег', 'LAST_NAME': 'Петров', 'UF_DEPARTMENT': []}),
+    ]
+
+    async def all_specialists():
+        return specialists
+
+    async def all_clients():
+        return [BXClient.model_validate({'ID': 30, 'NAME': 'Маша', 'LAST_NAME': 'Сидорова'})]
+
+    async def get_appointments(start, end, spec_ids=None):
+        return [
+            appointment(1, 12, '2025-07-07T10:00:00+03:00'),
+            appointment(2, 12, '2025-07-07T12:00:00+03:00'),
+            appointment(3, 14, '2025-07-08T10:00:00+03:00'),
+        ]
+
+    async def get_schedules(start, end, spec_ids=None):
+        return [{'id': 7, 'assignedById': 12, 'ufCrm4Date': '2025-07-07T00:00:00+03:00', 'ufCrm4Intervals': ['1:2']}]
+
+    async def get_production_calendar(id=3):
+        return {'CALENDAR': {'EXCLUSIONS': {'2025': {'7': {'8': 'Y', '10': 'Y'}}}}}
+
+    async def fill_previous(*appointments):
+        pass
+
+    monkeypatch.setitem(BXConstants.appointment.lfv.codeById, '52', 'L')
+    monkeypatch.setattr(SPECIALISTS, 'all', all_specialists)
+    monkeypatch.setattr(CLIENTS, 'all', all_clients)
+    monkeypatch.setattr(MIRROR, 'get_appointments', get_appointments)
+    monkeypatch.setattr(MIRROR, 'get_schedules', get_schedules)
+    monkeypatch.setattr(BitrixClient, 'get_production_calendar', get_production_calendar)
+    monkeypatch.setattr(api_main, 'fill_previous', fill_previous)
+    app = FastAPI()
+    app.include_router(api_main.router)
+    return TestClient(app)
+
+
+class TestView:
+
+    def test_grouped_by_specialist_and_day(self, client: TestClient):
+        response = client.get('/view', params={'start': '2025-07-06T21:00:00.000Z', 'end': '2025-07-09T21:00:00.000Z'})
+        assert response.status_code == 200
+        view = response.json()
+        # 2025-07-10 начинается ровно в конце периода и в него не входит
+        assert view['holidays'] == ['2025-07-08']
+        assert [c['id'] for c in view['clients']] == [30]
+        rows = {row['id']: row for row in view['specialists']}
+        # Специалист без занятий остается в таблице, неизвестный специалист добавляется без карточки
+        assert list(rows) == [12, 13, 14]
+        assert rows[13]['days'] == [] and rows[14]['specialist'] is None
+        day = rows[12]['days'][0]
+        assert day['date'] == '2025-07-07' and not day['holiday']
+        assert [s['id'] for s in day['schedules']] == [7]
+        assert [a['id'] for a in day['appointments']] == [1, 2]
+        assert rows[14]['days'][0]['holiday']
+
+    def test_unencoded_offset(self, client: TestClient):
+        # '+' смещения без кодирования приходит пробелом
+        response = client.get('/view?start=2025-07-07T00:00:00+03:00&end=2025-07-10T00:00:00+03:00')
+        assert response.status_code == 200
+        assert response.json()['holidays'] == ['2025-07-08']
+
+    def test_invalid_date(self, client: TestClient):
+        response = client.get('/view', params={'start': 'yesterday', 'end': '2025-07-10T00:00:00+03:00'})
+        assert response.status_code == 422